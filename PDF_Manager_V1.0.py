@@ -1,17 +1,68 @@
 from tkinter import (
     Tk, Canvas, Scrollbar, Frame, Label, HORIZONTAL, 
     VERTICAL, Menu, DISABLED, NORMAL, LEFT, RIGHT, SOLID,
-    Y, Listbox, SINGLE, Button, StringVar, Entry, Toplevel
+    Y, Listbox, SINGLE, Button, StringVar, Entry, Toplevel, BooleanVar
     )
-from tkinter.filedialog import askopenfilename, asksaveasfilename
+from tkinter.filedialog import askopenfilename, asksaveasfilename, askdirectory
 from tkinter.simpledialog import askstring, askfloat
-from tkinter.messagebox import askyesnocancel
+from tkinter.messagebox import askyesnocancel, askyesno
 from tkinter.messagebox import showinfo, showerror, showwarning
+from tkinter import ttk
 from pathlib import Path
 from io import BytesIO
-from PIL import Image, ImageTk
+from collections import OrderedDict, deque
+from itertools import zip_longest
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
+from PIL import Image, ImageTk, ImageChops
+import os
+import re
+import sys
+import math
+import glob
+import json
+import argparse
+import time
+import hashlib
+import pickle
+import zlib
+import logging
+import gzip
+import queue
+import threading
+import multiprocessing
 import fitz  # PyMuPDF
 
+# Background work that fails falls back quietly in the viewer, why is logged here
+logger = logging.getLogger("pdf_manager")
+
+# Per user cache directory for data derived from documents (thumbnails, indexes)
+CACHE_DIR = Path(os.environ.get("LOCALAPPDATA") or Path.home() / ".cache") / "pdf_manager"
+
+# Indirect references in PDF object source, and the back references that lead from a page to the whole tree
+PDF_REFERENCE = re.compile(r"(\d+) \d+ R")
+PDF_BACK_REFERENCE = re.compile(r"/(?:Parent|P)\s*\d+ \d+ R")
+
+# Punctuation around words, stripped for search
+SEARCH_TRIM = re.compile(r"^\W+|\W+$")
+
+# Merge input with its own page ranges, like invoice.pdf:1-3,5
+MERGE_INPUT = re.compile(r"^(.+):([\d\s,-]+)$")
+
+# save_file options of the Compress menu, shared with the batch command line
+COMPRESS_OPTIONS = dict(garbage=4, clean=True, deflate=True, deflate_images=True, deflate_fonts=True)
+
+# PIL format and file extension of each page image export format
+RASTER_FORMATS = {"png": ("PNG", ".png"), "jpeg": ("JPEG", ".jpg"), "tiff": ("TIFF", ".tif")}
+
+# Image settings of compress_file by preset name, dpi None keeps the resolution
+COMPRESS_PRESETS = {
+    "screen": dict(dpi=72, quality=50),
+    "ebook": dict(dpi=150, quality=75),
+    "print": dict(dpi=300, quality=85),
+    "archive": dict(dpi=None, quality=92, bilevel=False),
+}
+
 
 class GUI:
     def __init__(self, root):
@@ -31,6 +82,77 @@ class GUI:
         self.is_changed = False
         self.file_path = None
 
+        # Screen resolution used to render pages at their real size at 100% zoom
+        self.screen_dpi = self.root.winfo_fpixels("1i")
+
+        # Timing hooks in milliseconds, for the last frame and for the last frame of each quality
+        self.render_time = 0.0
+        self.render_times = {"draft": 0.0, "full": 0.0}
+
+        # Draft renders skip anti-aliasing and annotations and stay under draft_pixels
+        self.render_quality = StringVar(value="adaptive")
+        self.draft_pixels = 2_000_000
+        self.idle_delay = 400
+
+        # Rendered page bitmaps keyed by (page, zoom, rotation)
+        self.render_cache = RenderCache()
+
+        # Background renderer for the pages around the current one
+        self.prefetcher = PagePrefetcher(self.root, self.store_prefetched)
+        self.last_page = 0
+        self.selected_page = 0
+
+        # Thumbnails keyed by page xref, which stays stable when other pages are deleted
+        self.thumbnail_box = (96, 128)
+        self.thumbnail_cache = RenderCache(max_bytes=32 * 1024 * 1024)
+        self.thumbnail_loader = ThumbnailLoader(self.root, self.store_thumbnail, ThumbnailDiskCache(CACHE_DIR / "thumbnails"), self.thumbnail_box)
+        self.thumbnail_items = []
+        self.thumbnail_slots = {}
+
+        # Continuous scroll layout, page tops in canvas pixels at the current zoom
+        self.continuous_view = BooleanVar(value=False)
+        self.page_gap = 10
+        self.page_rects = None
+        self.page_offsets = []
+        self.layout_width = 0
+        self.layout_height = 0
+        self.page_items = []
+        self.page_slots = {}
+
+        # Above tile_zoom the single page view renders only the visible tiles with clip rectangles
+        self.tile_zoom = 3.0
+        self.tile_size = 512
+        self.tile_renderer = TileRenderer(self.root, self.store_tile, self.tile_size)
+        self.tiled_view = False
+        self.tiled_size = (0, 0)
+        self.tile_items = {}
+
+        # Pending coalesced render, see request_render
+        self.render_delay = 60
+        self.render_after_id = None
+
+        # Compress menu size projections, stamped with the document state they were made for
+        self.compress_estimate = None
+        self.compress_estimate_stamp = None
+
+        # Save, split or compress running in the background, edits wait for it
+        self.task = None
+
+        # Save appends small edits to the open file instead of writing a new one
+        self.incremental_save = BooleanVar(value=False)
+
+        # Search index filled page by page in the background, and the matches of the current query
+        self.search_index = SearchIndex()
+        self.search_dirty = False
+        self.text_indexer = TextIndexer(self.root, self.store_page_words)
+        self.search_text = StringVar()
+        self.search_page_xrefs = []
+        self.search_missing = set()
+        self.search_matches = []
+        self.search_pages = {}
+        self.search_match = -1
+        self.search_after_id = None
+
         # Create menubar
         self.create_menu()
 
@@ -53,10 +175,23 @@ class GUI:
         self.file_menu.add_command(label="Open", command=self.load_pdf, state=NORMAL)
         self.file_menu.add_command(label="Save", command=self.save_pdf, state=DISABLED)
         self.file_menu.add_command(label="Close", command=self.close_pdf, state=DISABLED)
+        self.file_menu.add_checkbutton(label="Save Changes Into Open File", variable=self.incremental_save)
+        self.file_menu.add_command(label="Document Info", command=self.document_info, state=DISABLED)
         self.file_menu.add_separator()
         self.file_menu.add_command(label="Exit", command=self.quit_prog)
         self.menubar.add_cascade(label="File", menu=self.file_menu)
 
+        # Create Edit Menu with Undo, Redo and Page Moves
+        self.edit_menu = Menu(self.menubar, tearoff=0)
+        self.edit_menu.add_command(label="Undo", command=self.undo_edit, accelerator="Ctrl+Z", state=DISABLED)
+        self.edit_menu.add_command(label="Redo", command=lambda: self.undo_edit(redo=True), accelerator="Ctrl+Y", state=DISABLED)
+        self.edit_menu.add_separator()
+        self.edit_menu.add_command(label="Move Page Up", command=lambda: self.move_page(-1))
+        self.edit_menu.add_command(label="Move Page Down", command=lambda: self.move_page(1))
+        self.menubar.add_cascade(label="Edit", menu=self.edit_menu, state=DISABLED)
+        self.root.bind("<Control-z>", lambda event: self.undo_edit())
+        self.root.bind("<Control-y>", lambda event: self.undo_edit(redo=True))
+
         # Create Merge Menu with Add to First and Add to Last
         self.merge_menu = Menu(self.menubar, tearoff=0)
         self.merge_menu.add_command(label="Add to First", command=lambda: self.merge_files(at_end=False))
@@ -66,11 +201,28 @@ class GUI:
         # Create Split Menu with range
         self.split_menu = Menu(self.menubar, tearoff=0)
         self.split_menu.add_command(label="Split by Range", command=self.split_pdf)
+        self.split_menu.add_command(label="Split by Size", command=self.split_pdf_by_size)
         self.menubar.add_cascade(label="Split", menu=self.split_menu, state=DISABLED)
 
-        # Create Compress Menu with Compress
-        self.compress_menu = Menu(self.menubar, tearoff=0)
-        self.compress_menu.add_command(label="Compress", command=self.compress_pdf)
+        # Create Export Menu with Page Images
+        self.export_menu = Menu(self.menubar, tearoff=0)
+        self.export_menu.add_command(label="Pages as Images", command=self.export_page_images)
+        self.export_menu.add_command(label="Embedded Images", command=self.export_embedded_images)
+        self.menubar.add_cascade(label="Export", menu=self.export_menu, state=DISABLED)
+
+        # Create View Menu with Continuous Scroll
+        self.view_menu = Menu(self.menubar, tearoff=0)
+        self.view_menu.add_checkbutton(label="Continuous Scroll", variable=self.continuous_view, command=self.toggle_continuous)
+        self.view_menu.add_separator()
+        self.view_menu.add_radiobutton(label="Draft While Scrolling", variable=self.render_quality, value="adaptive", command=self.show_page)
+        self.view_menu.add_radiobutton(label="Always Draft Quality", variable=self.render_quality, value="draft", command=self.show_page)
+        self.view_menu.add_radiobutton(label="Always Full Quality", variable=self.render_quality, value="full", command=self.show_page)
+        self.menubar.add_cascade(label="View", menu=self.view_menu)
+
+        # Create Compress Menu with one Entry per Preset, Labels Show the Estimated Result
+        self.compress_menu = Menu(self.menubar, tearoff=0, postcommand=self.refresh_compress_menu)
+        for name in COMPRESS_PRESETS:
+            self.compress_menu.add_command(label=self.compress_label(name), command=lambda name=name: self.compress_pdf(name))
         self.menubar.add_cascade(label="Compress", menu=self.compress_menu, state=DISABLED)
 
         # Create About Menu with About
@@ -89,8 +241,22 @@ class GUI:
         self.page_list_label.pack(pady=5)
 
         # Left Frame List Box for Page List 
-        self.page_listbox = Listbox(self.left_frame, selectmode=SINGLE, exportselection=0)
-        self.page_listbox.pack(fill=Y, expand=True)
+        self.page_listbox = Listbox(self.left_frame, selectmode=SINGLE, exportselection=0, height=10)
+        self.page_listbox.pack(fill=Y)
+
+        # Thumbnail Strip, only the thumbnails in view have canvas items
+        self.thumbnail_frame = Frame(self.left_frame)
+        self.thumbnail_frame.pack(fill=Y, expand=True, pady=5)
+        self.thumbnail_canvas = Canvas(self.thumbnail_frame, width=self.thumbnail_box[0] + 16)
+        self.thumbnail_canvas.pack(side=LEFT, fill=Y, expand=True)
+        self.thumbnail_scrollbar = Scrollbar(self.thumbnail_frame, orient=VERTICAL, command=self.thumbnail_canvas.yview)
+        self.thumbnail_scrollbar.pack(side=RIGHT, fill=Y)
+        self.thumbnail_canvas.configure(yscrollcommand=self.scroll_thumbnails)
+        self.thumbnail_canvas.bind("<Configure>", self.refresh_thumbnails)
+        self.thumbnail_canvas.bind("<ButtonRelease-1>", self.select_thumbnail)
+        self.thumbnail_canvas.bind("<Button-4>", lambda event: self.thumbnail_canvas.yview_scroll(-1, "units"))
+        self.thumbnail_canvas.bind("<Button-5>", lambda event: self.thumbnail_canvas.yview_scroll(1, "units"))
+        self.thumbnail_highlight = self.thumbnail_canvas.create_rectangle(0, 0, 0, 0, outline="blue", width=2, state="hidden")
 
     # Create Right Frame for tool Buttons
     def create_right_frame(self):
@@ -139,6 +305,29 @@ class GUI:
         self.password_button = Button(self.password_frame, text="Set Password", command=self.set_password, state=DISABLED)
         self.password_button.grid(row=1, column=0, columnspan=2, padx=5, pady=5)
     
+        # Search Frame
+        self.search_frame = Frame(self.right_frame, padx=10, pady=10, bd=2, relief=SOLID)
+        self.search_frame.pack(padx=10, pady=10)
+
+        # Search Area, Results Follow Typing and Enter Jumps to the Next Match
+        # Heading
+        self.search_label = Label(self.search_frame, text="Search")
+        self.search_label.grid(row=0, column=0, columnspan=2, padx=5, pady=5)
+
+        self.search_entry = Entry(self.search_frame, textvariable=self.search_text, width=16, state=DISABLED)
+        self.search_entry.grid(row=1, column=0, columnspan=2, padx=5, pady=5)
+        self.search_entry.bind("<KeyRelease>", self.request_search)
+        self.search_entry.bind("<Return>", lambda event: self.step_search_match(1))
+        self.search_entry.bind("<Shift-Return>", lambda event: self.step_search_match(-1))
+
+        self.search_previous_button = Button(self.search_frame, text="Previous", command=lambda: self.step_search_match(-1), state=DISABLED)
+        self.search_previous_button.grid(row=2, column=0, padx=5, pady=5)
+        self.search_next_button = Button(self.search_frame, text="Next", command=lambda: self.step_search_match(1), state=DISABLED)
+        self.search_next_button.grid(row=2, column=1, padx=5, pady=5)
+
+        self.search_result_label = Label(self.search_frame, text="")
+        self.search_result_label.grid(row=3, column=0, columnspan=2, padx=5, pady=5)
+
         # Add File Frame
         self.add_file_frame = Frame(self.right_frame, padx=10, pady=10, bd=2, relief=SOLID)
         self.add_file_frame.pack(padx=10, pady=10)        
@@ -159,7 +348,8 @@ class GUI:
         self.scrollbar_x = Scrollbar(root, orient=HORIZONTAL, command=self.canvas.xview)
         self.scrollbar_x.pack(side="bottom", fill="x")
 
-        self.canvas.configure(yscrollcommand=self.scrollbar_y.set, xscrollcommand=self.scrollbar_x.set)
+        self.canvas.configure(yscrollcommand=self.scroll_canvas, xscrollcommand=self.scroll_canvas_x)
+        self.canvas.bind("<Configure>", self.refresh_view)
 
         self.page_label = Label(root, text=f"Page:")
         self.page_label.pack(side="top", pady=5)
@@ -173,6 +363,7 @@ class GUI:
             # Disable Open Menu Enable Close Menu
             self.file_menu.entryconfig("Open", state=DISABLED)
             self.file_menu.entryconfig("Close", state=NORMAL)
+            self.file_menu.entryconfig("Document Info", state=NORMAL)
 
             # Enable Merge Menu
             if not self.pdf_object.need_password:
@@ -182,8 +373,14 @@ class GUI:
             if self.num_pages > 1:
                 self.menubar.entryconfig("Split", state=NORMAL)
             
-            # Enable Compress Menu
+            # Enable Compress and Export Menu
             self.menubar.entryconfig("Compress", state=NORMAL)
+            self.menubar.entryconfig("Export", state=NORMAL)
+
+            # Enable Edit Menu, Undo and Redo Only With Steps to Replay
+            self.menubar.entryconfig("Edit", state=NORMAL)
+            self.edit_menu.entryconfig("Undo", state=NORMAL if self.pdf_object.history.can_undo else DISABLED)
+            self.edit_menu.entryconfig("Redo", state=NORMAL if self.pdf_object.history.can_redo else DISABLED)
             
             # Bind Scroll Button Function
             self.page_listbox.bind("<ButtonRelease>", self.scroll_page_scale)
@@ -200,6 +397,11 @@ class GUI:
             # Enable Set Password Button if need_password is False
             if not self.pdf_object.need_password:
                 self.password_button.config(state=NORMAL)
+
+            # Enable Search
+            self.search_entry.config(state=NORMAL)
+            self.search_previous_button.config(state=NORMAL)
+            self.search_next_button.config(state=NORMAL)
         
         # If Document Not Available
         else:
@@ -207,6 +409,7 @@ class GUI:
             # Enable Open Menu Disable Close Menu
             self.file_menu.entryconfig("Open", state=NORMAL)
             self.file_menu.entryconfig("Close", state=DISABLED)
+            self.file_menu.entryconfig("Document Info", state=DISABLED)
 
             # Disable Merge Menu
             self.menubar.entryconfig("Merge", state=DISABLED)
@@ -214,8 +417,10 @@ class GUI:
             # Disable Split Menu
             self.menubar.entryconfig("Split", state=DISABLED)
 
-            # Disable Compress Menu
+            # Disable Compress, Export and Edit Menu
             self.menubar.entryconfig("Compress", state=DISABLED)
+            self.menubar.entryconfig("Export", state=DISABLED)
+            self.menubar.entryconfig("Edit", state=DISABLED)
 
             # Unbind Scroll Button Function
             self.page_listbox.unbind("<ButtonRelease>")
@@ -227,12 +432,26 @@ class GUI:
             self.delete_page_button.config(state=DISABLED)
             self.password_button.config(state=DISABLED)
 
+            # Disable Search
+            self.search_entry.config(state=DISABLED)
+            self.search_previous_button.config(state=DISABLED)
+            self.search_next_button.config(state=DISABLED)
+
         # If Change in Document Enable Save Button else Disable
         if self.is_changed:
             self.file_menu.entryconfig("Save", state=NORMAL)
         else:
             self.file_menu.entryconfig("Save", state=DISABLED)
 
+        # While a Background Task Runs the Document Can Only be Viewed
+        if self.task is not None:
+            self.file_menu.entryconfig("Save", state=DISABLED)
+            self.file_menu.entryconfig("Close", state=DISABLED)
+            for menu in ("Edit", "Merge", "Split", "Compress", "Export"):
+                self.menubar.entryconfig(menu, state=DISABLED)
+            self.delete_page_button.config(state=DISABLED)
+            self.password_button.config(state=DISABLED)
+
     # Load PDF file when Clicked on Open Menu item
     def load_pdf(self):
 
@@ -262,11 +481,31 @@ class GUI:
                 return
             
         if self.pdf_object.is_file_available:
+            self.pdf_object.start_index()
+            self.start_search_index()
             self.num_pages = self.pdf_object.get_page_count
             self.root.title(f"PDF Viewer - {self.file_path}")
+            self.populate_page_list()
+            self.layout_thumbnails()
             self.show_page()
             self.status_manager()
 
+    # Show What the Content Index Found in the Current Pages
+    def document_info(self):
+        index = self.pdf_object.index
+        if index is None:
+            showinfo("Document Info", "The document is still being indexed, please try again in a moment.")
+            return
+
+        info = index.summary(self.pdf_object.get_page_xrefs())
+        showinfo("Document Info", f"Pages: {self.num_pages} ({info['pages']} indexed)\n"
+                                  f"Pages with text: {info['text_pages']}, without text: {info['pages'] - info['text_pages']}\n"
+                                  f"Images: {info['images']} ({info['image_bytes'] / 1024 / 1024:.1f} MB)\n"
+                                  f"Fonts: {info['fonts']}\n"
+                                  f"Annotations: {info['annotations']}\n"
+                                  f"Encryption: {info['encryption'] or 'none'}\n"
+                                  f"Indexed in {index.seconds:.1f} s")
+
     # Prompt Password
     def password_prompt(self):
         password_var = StringVar()
@@ -307,16 +546,22 @@ class GUI:
         
         return password_var.get()
     
-    # Close PDF Document
-    def close_pdf(self):
+    # Close PDF Document, then is Called Once it Closed
+    def close_pdf(self, then=None):
+
+        # A Running Save Would be Left Half Done
+        if self.task is not None:
+            showwarning("Warning", f"Please wait for {self.task.title} to finish or cancel it.")
+            return
 
         # If any Change 
         if self.is_changed:
 
-            # Ask to Save
+            # Ask to Save, the Save Runs in the Background and Closes When Done
             result = askyesnocancel("Warning", "The document has been changed. Do you want to save the changes?")
             if result == True:
-                self.save_pdf()
+                self.save_pdf(on_saved=lambda: self.close_pdf(then))
+                return
                 
             elif result == False:
                 self.is_changed = False
@@ -330,9 +575,33 @@ class GUI:
             self.num_pages = 0
             self.is_changed = False
             self.file_path = None
+            if self.render_after_id is not None:
+                self.root.after_cancel(self.render_after_id)
+                self.render_after_id = None
+            self.prefetcher.cancel()
+            self.tile_renderer.cancel()
+            self.render_cache.clear()
+            self.thumbnail_loader.cancel()
+            self.thumbnail_cache.clear()
+            self.text_indexer.cancel()
+            if self.search_after_id is not None:
+                self.root.after_cancel(self.search_after_id)
+                self.search_after_id = None
+            self.search_index = SearchIndex()
+            self.search_page_xrefs = []
+            self.search_missing = set()
+            self.search_matches = []
+            self.search_pages = {}
+            self.search_match = -1
+            self.search_result_label.config(text="")
+            self.page_rects = None
+            self.page_offsets = []
+            self.page_items = []
+            self.page_slots = {}
 
             # Destroy All Data Showing Areas and Clear data
             self.page_listbox.delete(0, 'end')
+            self.layout_thumbnails()
             self.canvas.delete("all")
             self.page_label.config(text="Page:")
             self.canvas.config(scrollregion=(0, 0, 0, 0))
@@ -341,34 +610,43 @@ class GUI:
             # Change Title to Default
             self.root.title("PDF Viewer")
         self.status_manager()
+        if then and not self.is_changed:
+            then()
 
     # Show PDF File Data To Relevant areas
-    def show_page(self, *args):
+    def show_page(self, *args, draft=False):
         if not self.pdf_object.is_file_available:
             return
+
+        # The quality menu overrides what the caller asked for
+        if self.render_quality.get() != "adaptive":
+            draft = self.render_quality.get() == "draft"
         
-        self.page_label.config(text=f"Page: {self.current_page + 1}")
-        # Populate the page listbox
-        self.page_listbox.delete(0, 'end')
-        for page_number in range(1, self.num_pages + 1):
-            self.page_listbox.insert(page_number, f"Page {page_number}")
-        
-        # Update page listbox selection
-        self.page_listbox.selection_clear(0, 'end')
-        self.page_listbox.selection_set(self.current_page)
-        self.page_listbox.activate(self.current_page)
+        self.update_page_selection()
 
-        # Update Canvas with the image
-        page = self.pdf_object.get_page(self.current_page)
-        pix = page.get_pixmap()
+        # Continuous view scrolls to the page instead of drawing it alone
+        self.tiled_view = False
+        if self.continuous_view.get():
+            self.layout_pages()
+            self.scroll_to_page(self.current_page)
+            self.draw_search_highlights()
+            return
 
-        # Set Zoom Height and width
-        zoomed_width = int(pix.width * self.current_zoom)
-        zoomed_height = int(pix.height * self.current_zoom)
+        # High zoom draws only the visible part of the page
+        if self.current_zoom > self.tile_zoom:
+            self.show_tiled_page()
+            self.draw_search_highlights()
+            return
 
-        img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-        img = img.resize((zoomed_width, zoomed_height), Image.ADAPTIVE)
-        img = ImageTk.PhotoImage(img)
+        # Get the page bitmap from the render cache or render it at the target zoom
+        if draft:
+            img = self.get_draft_image(self.current_page)
+        else:
+            img = self.get_page_image(self.current_page)
+
+        # Set Zoom Height and width
+        zoomed_width = img.width()
+        zoomed_height = img.height()
 
         # off set dimensions
         offset_width = 0
@@ -382,27 +660,361 @@ class GUI:
         
         # Screen center
         self.canvas.config(scrollregion=(offset_width, offset_height, zoomed_width, zoomed_height))
+        self.canvas.delete("all")
+        self.page_items = []
+        self.tile_items = {}
         self.canvas.create_image(self.canvas.winfo_width() / 2, self.canvas.winfo_height() / 2, image=img)
         self.canvas.image = img  # Keep a reference to prevent image from being garbage collected
+        self.draw_search_highlights()
+
+        # Render the neighbouring pages in the background while this one is read
+        if not draft:
+            self.prefetch_neighbours(img.width() * img.height() * 4)
+
+    # Show Current Page Number in Label, Page List and Thumbnail Strip
+    def update_page_selection(self):
+        self.page_label.config(text=f"Page: {self.current_page + 1}")
+
+        # Update page listbox selection only, the list itself is kept in sync by the edits
+        self.page_listbox.selection_clear(self.selected_page)
+        self.page_listbox.selection_set(self.current_page)
+        self.page_listbox.activate(self.current_page)
+        self.page_listbox.see(self.current_page)
+        self.selected_page = self.current_page
+        self.highlight_thumbnail()
+
+    # Switch Between Single Page and Continuous Scroll View
+    def toggle_continuous(self):
+        self.canvas.delete("all")
+        self.canvas.image = None
+        self.page_items = []
+        self.page_slots = {}
+        self.show_page()
+
+    # Stack All Pages Vertically at the Current Zoom and Size the Scroll Region to Them
+    def layout_pages(self):
+        if self.page_rects is None:
+            self.page_rects = self.pdf_object.get_page_sizes()
+
+        scale = self.render_scale
+        y = 0
+        self.page_offsets = []
+        for width, height in self.page_rects:
+            self.page_offsets.append(y)
+            y += int(height * scale) + self.page_gap
+        self.layout_width = max((int(width * scale) for width, height in self.page_rects), default=0)
+        self.layout_height = y
+
+        # Keep narrow pages centred in a wide canvas
+        padding = max(self.canvas.winfo_width() - self.layout_width, 0) // 2
+        self.canvas.config(scrollregion=(-padding, 0, self.layout_width + padding, self.layout_height))
+
+    # Scroll Continuous View so the Page Starts at the Top
+    def scroll_to_page(self, page_number):
+        self.canvas.yview_moveto(self.page_offsets[page_number] / max(self.layout_height, 1))
+        self.refresh_continuous()
+
+    # Keep Scrollbars in Sync and Render What Scrolled into View
+    def scroll_canvas(self, first, last):
+        self.scrollbar_y.set(first, last)
+        self.refresh_view()
+
+    def scroll_canvas_x(self, first, last):
+        self.scrollbar_x.set(first, last)
+        self.refresh_view()
+
+    # Refresh Whichever View Renders Only the Visible Area
+    def refresh_view(self, *args):
+        self.refresh_continuous()
+        self.refresh_tiles()
+
+    # Size the Scroll Region to the Zoomed Page and Start Filling it with Tiles
+    def show_tiled_page(self):
+        width, height = self.pdf_object.get_page_size(self.current_page)
+        width, height = int(width * self.render_scale), int(height * self.render_scale)
+        self.tiled_size = (width, height)
+        self.tiled_view = True
+
+        # Keep a page narrower than the canvas centred
+        padding_x = max(self.canvas.winfo_width() - width, 0) // 2
+        padding_y = max(self.canvas.winfo_height() - height, 0) // 2
+        self.canvas.config(scrollregion=(-padding_x, -padding_y, width + padding_x, height + padding_y))
+        self.canvas.delete("all")
+        self.canvas.image = None
+        self.page_items = []
+        self.tile_items = {}
+        self.refresh_tiles()
+
+    # Show Cached Tiles Around the Viewport and Queue the Missing Ones, Centre First
+    def refresh_tiles(self, *args):
+        if not (self.tiled_view and self.pdf_object.is_file_available):
+            return
+
+        size = self.tile_size
+        left, top = self.canvas.canvasx(0), self.canvas.canvasy(0)
+        right, bottom = left + self.canvas.winfo_width(), top + self.canvas.winfo_height()
+        columns = range(max(int(left) // size - 1, 0), min(int(right) // size + 2, math.ceil(self.tiled_size[0] / size)))
+        rows = range(max(int(top) // size - 1, 0), min(int(bottom) // size + 2, math.ceil(self.tiled_size[1] / size)))
+
+        page_key = self.render_key(self.current_page)
+        wanted = set()
+        jobs = []
+        for row in rows:
+            for column in columns:
+                key = page_key + (column, row)
+                wanted.add(key)
+                if key in self.tile_items:
+                    continue
+                img = self.render_cache.get(key)
+                self.tile_items[key] = self.canvas.create_image(column * size, row * size, anchor="nw", image=img or "")
+                if img is None:
+                    jobs.append((key, self.current_page, self.render_scale))
+
+        # Drop tiles that scrolled out of reach, the render cache may still hold them
+        for key in list(self.tile_items):
+            if key not in wanted:
+                self.canvas.delete(self.tile_items.pop(key))
+
+        centre_x, centre_y = (left + right) / 2, (top + bottom) / 2
+        jobs.sort(key=lambda job: abs((job[0][-2] + 0.5) * size - centre_x) + abs((job[0][-1] + 0.5) * size - centre_y))
+        self.tile_renderer.submit(self.pdf_object, jobs)
+        self.canvas.tag_raise("search")
+
+    # Store Tile From the Tile Renderer and Show it if Still Placed, Called on the Tk Thread
+    def store_tile(self, key, pix):
+        img = pixmap_to_photo(pix)
+        self.render_cache.put(key, img, pix.width * pix.height * 4)
+        if key in self.tile_items:
+            self.canvas.itemconfig(self.tile_items[key], image=img)
+
+    # Place Pages Near the Viewport on Recycled Canvas Items, Render Visible Ones Now and Prefetch the Margin
+    def refresh_continuous(self, *args):
+        if not (self.continuous_view.get() and self.pdf_object.is_file_available and self.page_offsets):
+            return
+
+        top = self.canvas.canvasy(0)
+        height = self.canvas.winfo_height()
+
+        # One viewport of margin above and below
+        first = max(bisect_right(self.page_offsets, top - height) - 1, 0)
+        last = min(bisect_right(self.page_offsets, top + 2 * height), self.num_pages)
+        visible = range(first, last)
+
+        while len(self.page_items) < len(visible):
+            self.page_items.append(self.canvas.create_image(0, 0, anchor="n"))
+
+        jobs = []
+        self.page_slots = {}
+        for item, page_number in zip_longest(self.page_items, visible):
+            if page_number is None:
+                self.canvas.itemconfig(item, image="", state="hidden")
+                continue
+
+            key = self.render_key(page_number)
+            img = self.render_cache.get(key)
+            page_top = self.page_offsets[page_number]
+            page_bottom = page_top + int(self.page_rects[page_number][1] * self.render_scale)
+            if img is None and page_top < top + height and page_bottom > top:
+                img = self.render_page_image(page_number, key)
+            elif img is None:
+                jobs.append((key, page_number, self.render_scale))
+
+            self.canvas.coords(item, self.layout_width / 2, page_top)
+            self.canvas.itemconfig(item, image=img or "", state="normal")
+            self.page_slots[key] = item
+        self.prefetcher.submit(self.pdf_object, jobs)
+        self.canvas.tag_raise("search")
+
+        # The page at the top of the viewport is the current page
+        page_number = max(bisect_right(self.page_offsets, top + 1) - 1, 0)
+        if page_number != self.current_page:
+            self.current_page = page_number
+            self.update_page_selection()
+            self.draw_search_highlights()
+
+    # Populate the Page Listbox Once per Document
+    def populate_page_list(self):
+        self.page_listbox.delete(0, 'end')
+        self.page_listbox.insert('end', *(f"Page {page_number}" for page_number in range(1, self.num_pages + 1)))
+        self.selected_page = 0
+
+    # Thumbnail Slot Size in the Strip
+    @property
+    def thumbnail_slot(self):
+        return self.thumbnail_box[0] + 16, self.thumbnail_box[1] + 24
+
+    # Size the Thumbnail Strip Scroll Region to the Page Count
+    def layout_thumbnails(self):
+        slot_width, slot_height = self.thumbnail_slot
+        self.thumbnail_canvas.config(scrollregion=(0, 0, slot_width, self.num_pages * slot_height))
+        self.refresh_thumbnails()
+
+    # Keep Scrollbar in Sync and Show the Thumbnails Scrolled into View
+    def scroll_thumbnails(self, first, last):
+        self.thumbnail_scrollbar.set(first, last)
+        self.refresh_thumbnails()
+
+    # Place the Visible Thumbnails on Recycled Canvas Items and Queue the Missing Ones
+    def refresh_thumbnails(self, *args):
+        canvas = self.thumbnail_canvas
+        slot_width, slot_height = self.thumbnail_slot
+        top = int(canvas.canvasy(0))
+        first = max(top // slot_height, 0)
+        last = min((top + canvas.winfo_height()) // slot_height + 1, self.num_pages)
+        visible = range(first, last) if self.pdf_object.is_file_available else range(0)
+
+        while len(self.thumbnail_items) < len(visible):
+            self.thumbnail_items.append((canvas.create_image(0, 0, anchor="n"), canvas.create_text(0, 0, anchor="n")))
+
+        jobs = []
+        self.thumbnail_slots = {}
+        for items, page_number in zip_longest(self.thumbnail_items, visible):
+            image_item, text_item = items
+            if page_number is None:
+                canvas.itemconfig(image_item, image="", state="hidden")
+                canvas.itemconfig(text_item, state="hidden")
+                continue
+
+            key = (self.pdf_object.get_page_xref(page_number),)
+            img = self.thumbnail_cache.get(key)
+            y = page_number * slot_height
+            canvas.coords(image_item, slot_width / 2, y + 4)
+            canvas.itemconfig(image_item, image=img or "", state="normal")
+            canvas.coords(text_item, slot_width / 2, y + self.thumbnail_box[1] + 6)
+            canvas.itemconfig(text_item, text=str(page_number + 1), state="normal")
+            self.thumbnail_slots[key] = image_item
+            if img is None:
+                jobs.append((key, page_number, None))
+        self.thumbnail_loader.submit(self.pdf_object, jobs)
+        self.highlight_thumbnail(scroll=False)
+
+    # Store Thumbnail From the Loader and Show it if Still in View, Called on the Tk Thread
+    def store_thumbnail(self, key, pix):
+        img = pixmap_to_photo(pix)
+        self.thumbnail_cache.put(key, img, pix.width * pix.height * 4)
+        if key in self.thumbnail_slots:
+            self.thumbnail_canvas.itemconfig(self.thumbnail_slots[key], image=img)
+
+    # Frame the Current Page Thumbnail and Bring it into View
+    def highlight_thumbnail(self, scroll=True):
+        canvas = self.thumbnail_canvas
+        if not self.pdf_object.is_file_available:
+            canvas.itemconfig(self.thumbnail_highlight, state="hidden")
+            return
+
+        slot_width, slot_height = self.thumbnail_slot
+        y = self.current_page * slot_height
+        canvas.coords(self.thumbnail_highlight, 2, y + 1, slot_width - 2, y + slot_height - 1)
+        canvas.itemconfig(self.thumbnail_highlight, state="normal")
+        canvas.tag_raise(self.thumbnail_highlight)
+
+        top = canvas.canvasy(0)
+        if scroll and not top <= y <= top + canvas.winfo_height() - slot_height:
+            canvas.yview_moveto(y / max(self.num_pages * slot_height, 1))
+
+    # Show the Page of the Clicked Thumbnail
+    def select_thumbnail(self, event):
+        page_number = int(self.thumbnail_canvas.canvasy(event.y)) // self.thumbnail_slot[1]
+        if 0 <= page_number < self.num_pages:
+            self.current_page = page_number
+            self.show_page()
+            self.status_manager()
+
+    # Render Cache Key of a Page at the Current Zoom
+    def render_key(self, page_number):
+        return page_number, round(self.current_zoom, 4), self.pdf_object.get_page_rotation(page_number)
+
+    # Get Page Bitmap from Render Cache or Render it Once at the Target Zoom
+    def get_page_image(self, page_number):
+        key = self.render_key(page_number)
+        img = self.render_cache.get(key)
+        if img is None:
+            img = self.render_page_image(page_number, key)
+        return img
+
+    # Render Page Bitmap at the Target Zoom and Store it in the Render Cache
+    def render_page_image(self, page_number, key):
+        start = time.perf_counter()
+        pix = self.pdf_object.render_page(page_number, self.render_scale)
+        img = pixmap_to_photo(pix)
+        self.record_render_time("full", start)
+
+        # Tk keeps photo images as 32 bit pixels
+        self.render_cache.put(key, img, pix.width * pix.height * 4)
+        return img
+
+    # Render a Draft of the Page Within the Pixel Budget, Stretched to the Target Size and Never Cached
+    def get_draft_image(self, page_number):
+        start = time.perf_counter()
+        width, height = self.pdf_object.get_page_size(page_number)
+        scale = draft_scale(width, height, self.render_scale, self.draft_pixels)
+        pix = self.pdf_object.render_page(page_number, scale, draft=True)
+
+        img = Image.frombuffer("RGB", (pix.width, pix.height), pix.samples_mv, "raw", "RGB", 0, 1)
+        if scale < self.render_scale:
+            img = img.resize((int(width * self.render_scale), int(height * self.render_scale)), Image.NEAREST)
+        img = ImageTk.PhotoImage(img)
+        self.record_render_time("draft", start)
+        return img
+
+    # Timing Hook Shared by Draft and Full Quality Renders
+    def record_render_time(self, quality, start):
+        self.render_time = (time.perf_counter() - start) * 1000
+        self.render_times[quality] = self.render_time
+
+    # Queue Pages N+-k Not Yet Cached for Background Rendering, Reading Direction First
+    def prefetch_neighbours(self, page_bytes):
+        step = -1 if self.current_page < self.last_page else 1
+        self.last_page = self.current_page
+
+        # Prefetch no more pages than the memory budget allows
+        limit = min(self.prefetcher.max_bytes, self.render_cache.max_bytes // 2) // max(page_bytes, 1)
+
+        jobs = []
+        for distance in range(1, self.prefetcher.radius + 1):
+            for page_number in (self.current_page + step * distance, self.current_page - step * distance):
+                if len(jobs) >= limit:
+                    break
+                if 0 <= page_number < self.num_pages:
+                    key = self.render_key(page_number)
+                    if key not in self.render_cache:
+                        jobs.append((key, page_number, self.render_scale))
+        self.prefetcher.submit(self.pdf_object, jobs)
+
+    # Store Page Rendered by the Prefetcher, Called on the Tk Thread
+    def store_prefetched(self, key, pix):
+        img = pixmap_to_photo(pix)
+        self.render_cache.put(key, img, pix.width * pix.height * 4)
+        if key in self.page_slots:
+            self.canvas.itemconfig(self.page_slots[key], image=img)
+
+    # MuPDF Matrix Scale for Current Zoom and Screen DPI
+    @property
+    def render_scale(self):
+        return self.current_zoom * self.screen_dpi / 72
 
     # Scroll Button 
     def scroll_page_scale(self, event):
-        # If Button 1 Released
-        if event.num == 1:
+        # If Button 1 Released, a click on the continuous view must not snap it to the page top
+        if event.num == 1 and not (self.continuous_view.get() and event.widget is self.canvas):
             selected_index = self.page_listbox.curselection()
             if selected_index:
                 self.current_page = selected_index[0]
                 self.show_page()
                 self.status_manager()
 
+        # Continuous view scrolls the canvas, pages follow the viewport
+        if event.num in (4, 5) and self.continuous_view.get():
+            self.canvas.yview_scroll(-2 if event.num == 4 else 2, "units")
+            return
+
         # If Scroll UP
         if event.num == 4:
             # Check if the current value is greater than 1
             if self.current_page > 0:
                 # Decrement the value by 1
                 self.current_page -= 1
-                self.show_page()
-                self.status_manager()
+                self.request_render()
 
         # If Scroll Down
         elif event.num == 5:
@@ -410,20 +1022,62 @@ class GUI:
             if self.current_page < self.num_pages - 1:
                 # Increment the value by 1
                 self.current_page += 1
-                self.show_page()
-                self.status_manager()
+                self.request_render()
+
+    # Collapse Wheel and Zoom Storms into One Render of the Latest Page and Zoom
+    def request_render(self):
+        if self.render_after_id is not None:
+            self.root.after_cancel(self.render_after_id)
+            self.render_after_id = None
+
+        # Queued neighbours and tiles of the previous target are stale now
+        self.prefetcher.submit(self.pdf_object, [])
+        self.tile_renderer.cancel()
+
+        # A cached bitmap at this zoom costs nothing to show, anything else waits for input to settle
+        if self.render_key(self.current_page) in self.render_cache and self.current_zoom <= self.tile_zoom:
+            self.flush_render()
+            return
+        self.show_placeholder()
+        self.render_after_id = self.root.after(self.render_delay, self.flush_render)
+
+    # Draft While Input is Still Arriving, Full Quality Once it Has Been Idle for idle_delay
+    def flush_render(self, draft=True):
+        self.render_after_id = None
+        draft = draft and self.render_key(self.current_page) not in self.render_cache
+        self.show_page(draft=draft)
+        self.status_manager()
+        if draft and self.render_quality.get() == "adaptive" and not self.tiled_view and not self.continuous_view.get():
+            self.render_after_id = self.root.after(self.idle_delay, self.flush_render, False)
+
+    # Show a Cached Bitmap of the Page at Another Zoom, or its Thumbnail, Until the Real Render Lands
+    def show_placeholder(self):
+        self.update_page_selection()
+        if self.continuous_view.get():
+            return
+
+        img = self.render_cache.closest(self.current_page, self.current_zoom, self.pdf_object.get_page_rotation(self.current_page))
+        if img is None:
+            img = self.thumbnail_cache.get((self.pdf_object.get_page_xref(self.current_page),))
+        if img is None:
+            return
+
+        self.canvas.delete("all")
+        self.page_items = []
+        self.tile_items = {}
+        self.tiled_view = False
+        self.canvas.create_image(self.canvas.winfo_width() / 2, self.canvas.winfo_height() / 2, image=img)
+        self.canvas.image = img
 
     # Zoom in
     def zoom_in(self):
         self.current_zoom *= 1.1
-        self.show_page()
-        self.status_manager()
+        self.request_render()
 
     # Zoom Out
     def zoom_out(self):
         self.current_zoom /= 1.1
-        self.show_page()
-        self.status_manager()
+        self.request_render()
 
     # PDF Document Page Delete Confirmation
     def delete_page_confirmation(self):
@@ -434,18 +1088,241 @@ class GUI:
             return
         
         # Delete the page self.current_page from the PDF document
+        self.prefetcher.cancel()
+        self.tile_renderer.cancel()
         self.pdf_object.delete_page_no(self.current_page)
+        self.render_cache.remove_page(self.current_page)
         self.is_changed = True
 
-        # Update the number of pages
+        # Update the number of pages, labels are positional so only the last one goes
         self.num_pages -= 1
+        self.page_listbox.delete('end')
+        self.page_rects = None
+        self.thumbnail_loader.cancel()
+        self.layout_thumbnails()
+        self.index_search_pages()
 
         # Update the current page
         if self.current_page >= self.num_pages:
             self.current_page = self.num_pages - 1
+        self.run_search(keep_position=True)
+        self.show_page()
+        self.status_manager()
+
+    # Undo or Redo the Last Page Delete, Move or Merge
+    def undo_edit(self, redo=False):
+        if not self.pdf_object.is_file_available or self.task is not None:
+            return
+
+        self.prefetcher.cancel()
+        self.tile_renderer.cancel()
+        applied = self.pdf_object.redo() if redo else self.pdf_object.undo()
+        if applied:
+            self.render_cache.apply_page_changes(applied)
+            self.pages_changed()
+
+    # Move the Current Page One Place Up or Down and Follow it
+    def move_page(self, step):
+        target = self.current_page + step
+        if not 0 <= target < self.num_pages or self.task is not None:
+            return
+
+        self.prefetcher.cancel()
+        self.tile_renderer.cancel()
+        self.pdf_object.move_page(self.current_page, target)
+        self.render_cache.move_page(self.current_page, target)
+        self.current_page = target
+        self.pages_changed()
+
+    # Resize the Page List and Thumbnail Strip After an Edit, Labels are Positional
+    def pages_changed(self):
+        page_count = self.pdf_object.get_page_count
+        if page_count < self.num_pages:
+            self.page_listbox.delete(page_count, 'end')
+        else:
+            self.page_listbox.insert('end', *(f"Page {page_number}" for page_number in range(self.num_pages + 1, page_count + 1)))
+        self.num_pages = page_count
+        self.page_rects = None
+        self.thumbnail_loader.cancel()
+        self.layout_thumbnails()
+        self.current_page = min(self.current_page, self.num_pages - 1)
+        self.is_changed = True
+        self.index_search_pages()
+        self.run_search(keep_position=True)
         self.show_page()
         self.status_manager()
 
+    # Saved Search Index of a File, Keyed by Content Hash Like the Thumbnails
+    @staticmethod
+    def search_index_path(pdf_object):
+        return CACHE_DIR / "search" / f"{pdf_object.content_hash}.json.gz"
+
+    # Load the Saved Search Index on a Thread, the Pages it Lacks are Indexed Once it Arrives
+    def start_search_index(self):
+        self.search_index = SearchIndex()
+        self.search_dirty = False
+        self.text_indexer.cancel()
+        pdf_object = self.pdf_object
+        if not pdf_object.disk_cacheable:
+            self.index_search_pages()
+            return
+
+        loaded = []
+        thread = threading.Thread(target=lambda: loaded.append(SearchIndex.load(self.search_index_path(pdf_object))), daemon=True)
+        thread.start()
+        self.root.after(50, self.poll_search_index, pdf_object, thread, loaded)
+
+    def poll_search_index(self, pdf_object, thread, loaded):
+        if thread.is_alive():
+            self.root.after(50, self.poll_search_index, pdf_object, thread, loaded)
+            return
+
+        # The document was closed or reloaded meanwhile
+        if pdf_object is not self.pdf_object or not pdf_object.is_file_available:
+            return
+        if loaded:
+            self.search_index = loaded[0]
+        self.index_search_pages()
+        self.run_search(keep_position=True)
+
+    # Queue the Pages Missing From the Search Index, Called After Every Page Edit
+    def index_search_pages(self):
+        self.search_page_xrefs = self.pdf_object.get_page_xrefs()
+        jobs = [((xref,), page_number, None) for page_number, xref in enumerate(self.search_page_xrefs) if xref not in self.search_index]
+        self.search_missing = {job[0][0] for job in jobs}
+        self.text_indexer.submit(self.pdf_object, jobs)
+
+    # Add Words From the Text Indexer, Called on the Tk Thread
+    def store_page_words(self, key, words):
+        # An edit queues again the pages still missing, one already being extracted then arrives twice
+        self.search_missing.discard(key[0])
+        if key[0] in self.search_index:
+            return
+        self.search_index.add_page(key[0], words)
+        if key[0] < self.pdf_object.original_xref_count:
+            self.search_dirty = True
+
+        # Results grow while the indexer runs, refreshed at most every few keystrokes worth of time
+        if self.search_text.get().strip() and self.search_after_id is None:
+            self.search_after_id = self.root.after(300, self.run_search, True)
+        self.save_search_index()
+
+    # Write the Search Index of the Pages Saved in the File Once All Pages are In
+    def save_search_index(self):
+        pdf_object = self.pdf_object
+        if not (self.search_dirty and not self.search_missing and pdf_object.disk_cacheable):
+            return
+
+        # Merged pages not saved yet have no place in an index keyed by the file contents
+        self.search_dirty = False
+        original = pdf_object.original_xref_count
+        pages = {xref: words for xref, words in self.search_index.pages.items() if xref < original}
+        index = self.search_index
+        threading.Thread(target=lambda: index.save(self.search_index_path(pdf_object), pages), daemon=True).start()
+
+    # Search a Moment After Typing Stops
+    def request_search(self, event=None):
+        if event is not None and event.keysym in ("Return", "Shift_L", "Shift_R"):
+            return
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+        self.search_after_id = self.root.after(150, self.run_search)
+
+    # Find the Query in the Indexed Pages, keep_position Stays on the Current Match When Results Refresh
+    def run_search(self, keep_position=False):
+        self.search_after_id = None
+        if not self.pdf_object.is_file_available:
+            return
+
+        current = self.search_matches[self.search_match] if 0 <= self.search_match < len(self.search_matches) else None
+        self.search_matches = self.search_index.search(self.search_text.get(), self.search_page_xrefs)
+        self.search_pages = {}
+        for match_number, (page_number, rects) in enumerate(self.search_matches):
+            self.search_pages.setdefault(page_number, []).append((match_number, rects))
+
+        if keep_position and current in self.search_matches:
+            self.search_match = self.search_matches.index(current)
+            self.update_search_label()
+            self.draw_search_highlights()
+        else:
+            # Start From the First Match at or After the Current Page
+            self.search_match = -1
+            for match_number, (page_number, rects) in enumerate(self.search_matches):
+                if page_number >= self.current_page:
+                    self.search_match = match_number
+                    break
+            else:
+                self.search_match = 0 if self.search_matches else -1
+            if keep_position:
+                self.update_search_label()
+                self.draw_search_highlights()
+            else:
+                self.show_search_match()
+
+    # Go to the Next or Previous Match, Wrapping Around
+    def step_search_match(self, step):
+        if not self.search_matches:
+            return
+        self.search_match = (self.search_match + step) % len(self.search_matches)
+        self.show_search_match()
+
+    def show_search_match(self):
+        self.update_search_label()
+        if self.search_match < 0:
+            self.draw_search_highlights()
+            return
+        page_number = self.search_matches[self.search_match][0]
+        if page_number != self.current_page or self.continuous_view.get():
+            self.current_page = page_number
+            self.show_page()
+        else:
+            self.draw_search_highlights()
+
+    def update_search_label(self):
+        if not self.search_text.get().strip():
+            text = ""
+        elif not self.search_matches:
+            text = "No matches"
+        else:
+            text = f"{self.search_match + 1} of {len(self.search_matches)}"
+        if self.search_missing:
+            text += f" ({len(self.search_page_xrefs) - len(self.search_missing)}/{len(self.search_page_xrefs)} pages)"
+        self.search_result_label.config(text=text.strip())
+
+    # Top Left of a Page on the Canvas and its Scale, for Whichever View is Showing
+    def page_origin(self, page_number):
+        width, height = self.pdf_object.get_page_size(page_number)
+        if self.continuous_view.get():
+            if not self.page_offsets:
+                return None
+            scale = self.render_scale
+            return self.layout_width / 2 - width * scale / 2, self.page_offsets[page_number], scale
+        if self.tiled_view:
+            return 0, 0, self.render_scale
+        if page_number != self.current_page or self.canvas.image is None:
+            return None
+        img = self.canvas.image
+        return self.canvas.winfo_width() / 2 - img.width() / 2, self.canvas.winfo_height() / 2 - img.height() / 2, img.width() / width
+
+    # Frame the Matches on the Pages Around the Current One, the Current Match Stands Out
+    def draw_search_highlights(self):
+        self.canvas.delete("search")
+        if not self.search_matches:
+            return
+
+        pages = range(max(self.current_page - 2, 0), min(self.current_page + 3, self.num_pages)) if self.continuous_view.get() else [self.current_page]
+        for page_number in pages:
+            matches = self.search_pages.get(page_number)
+            origin = self.page_origin(page_number) if matches else None
+            if origin is None:
+                continue
+            left, top, scale = origin
+            for match_number, rects in matches:
+                colour = "orange" if match_number == self.search_match else "yellow"
+                for x0, y0, x1, y1 in rects:
+                    self.canvas.create_rectangle(left + x0 * scale, top + y0 * scale, left + x1 * scale, top + y1 * scale,
+                                                 outline=colour, width=2, tags="search")
+
     # Set Password to PDF file
     def set_password(self):
         
@@ -468,7 +1345,7 @@ class GUI:
                 
             else:
                 password_popup.destroy()
-                self.save_pdf(owner_pass.get(), user_pass.get())
+                self.save_pdf(owner_pass=owner_pass.get(), user_pass=user_pass.get())
 
         def cancel(event=None):
             password_popup.destroy()
@@ -507,25 +1384,60 @@ class GUI:
     # Merge Files
     def merge_files(self, at_end):
         
-        # Open File 
-        self.file_path = askopenfilename(filetypes=[("PDF Files", "*.pdf")])
+        # Open File, the Open Document Keeps its Own Path
+        file_path = askopenfilename(filetypes=[("PDF Files", "*.pdf")])
 
         # If File is not Selected
-        if not self.file_path:
+        if not file_path:
             return
         pdf_obj_2 = PDFManager()
-        pdf_obj_2.load_pdf(self.file_path)
+        pdf_obj_2.load_pdf(file_path)
 
         if pdf_obj_2.need_password:
             showerror('Error', 'Password Protected Files cannot be merged')
             return
         
         # Add File to first
-        self.pdf_object.merge_pdf(pdf_obj_2, at_end=at_end)
+        self.prefetcher.cancel()
+        self.tile_renderer.cancel()
+        dedup = self.pdf_object.merge_pdf(pdf_obj_2, at_end=at_end)
+
+        # Pages already rendered move down when the file is added to first
+        if not at_end:
+            self.render_cache.insert_pages(0, pdf_obj_2.get_page_count)
+
+        # Append labels for the new pages, existing labels stay valid
+        self.page_listbox.insert('end', *(f"Page {page_number}" for page_number in range(self.num_pages + 1, self.pdf_object.get_page_count + 1)))
         self.num_pages = self.pdf_object.get_page_count
+        self.page_rects = None
+        self.thumbnail_loader.cancel()
+        self.layout_thumbnails()
+        self.index_search_pages()
+        self.run_search(keep_position=True)
         self.is_changed = True
         self.show_page()
+        self.status_manager()
+
+        # Fonts and images the merged file shares with the document are kept once
+        if dedup["duplicates"]:
+            showinfo("Merged", f"{pdf_obj_2.get_page_count} pages added. {dedup['duplicates']} duplicate objects were shared "
+                               f"with the document ({dedup['bytes_saved'] / 1024:.0f} KB saved).")
     
+    # Run a Save, Split or Compress on a Worker Thread, on_done Gets its Result on the Tk Thread
+    def run_task(self, title, function, on_done, error_message):
+        def finished(result, error):
+            self.task = None
+            if isinstance(error, OperationCancelled):
+                showinfo("Cancelled", f"{title} cancelled, no files were written.")
+            elif error is not None:
+                showerror("Error", f"{error_message} {error}")
+            else:
+                on_done(result)
+            self.status_manager()
+
+        self.task = BackgroundTask(self.root, title, function, finished)
+        self.status_manager()
+
     # Split PDF File into page ranges
     def split_pdf(self):
         if self.is_changed:
@@ -533,123 +1445,320 @@ class GUI:
             return
         
         # Get Split ranges from user
-        split_ranges = askstring("Split Ranges", f"Enter the split ranges (e.g. 1-3,5-5,7-9) Last Page is {self.num_pages}:")
+        split_ranges = askstring("Split Ranges", f"Enter the split ranges (e.g. 1-3,5,7-9 or every 10) Last Page is {self.num_pages}:")
+        if not split_ranges:
+            return
 
-        if split_ranges:
-            split_ranges.strip()
-            
-            # Check ' in split ranges
-            if ',' in split_ranges:
+        try:
+            split_ranges_list = parse_page_ranges(split_ranges, self.num_pages)
+        except ValueError as e:
+            showerror("Error", str(e))
+            return
 
-                # Split ranges by ',' and save in split_ranges_list
-                split_ranges_list = split_ranges.split(',')
-                split_ranges_list = [item.strip() for item in split_ranges_list]
-            else:
-                split_ranges_list = [split_ranges]
+        # All parts are written in one pass, named like file_1_3.pdf
+        output_dir = askdirectory(title="Split Into Folder", initialdir=str(Path(self.pdf_object.file_path).parent))
+        if not output_dir:
+            return
+        output_files = [split_output_path(output_dir, Path(self.pdf_object.file_path).stem, split_range) for split_range in split_ranges_list]
+        if not self.confirm_overwrite(output_files):
+            return
 
-            try:
-                # Convert split ranges to list of integers tuples which are separated by -
-                split_ranges_list = [tuple(map(int, item.split('-'))) for item in split_ranges_list]
-            except ValueError:
-                showerror("Error", "Invalid split ranges. (e.g. 1-3,5-5,7-9)")
-                return
-            
-            invalid_ranges = []
+        def split_done(report):
+            total_bytes = sum(output["bytes"] for output in report["outputs"])
+            showinfo("Success", f"{len(report['outputs'])} files written to {Path(output_dir).name} "
+                                f"in {report['seconds']:.1f} s ({total_bytes / 1024 / 1024:.1f} MB).")
 
-            for item in split_ranges_list[:]:
-                
-                # Check if tuple first element is greater than end page
-                if 1 <= item[0] <= self.num_pages and 1 <= item[1] <= self.num_pages and item[0] <= item[1]:
-                    
-                    self.pdf_object.backup_pdf
-
-                    # Split PDF
-                    self.pdf_object.split_pdf(item)
-                    
-                    self.save_pdf(initial_file=f"{Path(self.file_path).stem}_{item[0]}_{item[1]}.pdf")
-                    self.is_changed = False
-
-                    self.pdf_object.restore_pdf
-                
-                else:
-                    showerror("Error", f"Invalid split ranges.{item[0]}-{item[1]} not valid in {self.num_pages} Page PDF Document")
-                    continue
-    
-    # Compress PDF File
-    def compress_pdf(self):
-        garbage = 4
-        clean = True
-        deflate = True
-        deflate_images = True
-        deflate_fonts = True
-        self.save_pdf(garbage=garbage, clean=clean, deflate=deflate, deflate_images=deflate_images, deflate_fonts=deflate_fonts)
+        self.run_task("Splitting", lambda cancel, progress: self.pdf_object.split_pdf(split_ranges_list, output_dir, cancel=cancel, progress=progress),
+                      split_done, "Failed to split PDF file.")
     
-    # Save PDF File
-    def save_pdf(self,
-                output_file=None,
-                 garbage=0, 
-                 clean=False, 
-                 deflate=False, 
-                 deflate_images=False, 
-                 deflate_fonts=False, 
-                 owner_pass=None, 
-                 user_pass=None, 
-                 initial_file=None):
+    # Ask Before Replacing Any of output_files That Already Exist, True Means Go Ahead
+    def confirm_overwrite(self, output_files):
+        existing = [Path(output_file).name for output_file in output_files if os.path.exists(output_file)]
+        if not existing:
+            return True
+        names = "\n".join(existing[:10]) + (f"\n... and {len(existing) - 10} more" if len(existing) > 10 else "")
+        return askyesno("Replace Files", f"{len(existing)} files already exist and will be replaced:\n{names}\n\nDo you want to continue?")
 
-        if output_file:
-            output_file = str(Path(self.file_path).parent / output_file)
-        else:
+    # Split PDF File into the Fewest Parts Under a Maximum File Size
+    def split_pdf_by_size(self):
+        if self.is_changed:
+            showwarning("Warning", "Please Save all Changes Before Splitting the File.")
+            return
 
-            # Get Output File
-            output_file = asksaveasfilename(title="Save PDF", filetypes=[("PDF Files", "*.pdf")], initialfile=initial_file)
-        
+        max_size = askfloat("Split by Size", "Enter the maximum file size in MB (e.g. 10):", minvalue=0.01)
+        if not max_size:
+            return
 
-        if output_file:
+        output_dir = askdirectory(title="Split Into Folder", initialdir=str(Path(self.pdf_object.file_path).parent))
+        if not output_dir:
+            return
 
-            # IF file name not ending with PDF then Set
-            if not output_file.endswith(".pdf"):
-                output_file += ".pdf"
+        # Part ranges are only known once planned, any earlier split of this file may be replaced
+        stem = glob.escape(Path(self.pdf_object.file_path).stem)
+        if not self.confirm_overwrite(glob.glob(os.path.join(glob.escape(output_dir), f"{stem}_*_*.pdf"))):
+            return
 
-            # If owner or user password set then set encryption as fitz.PDF_ENCRYPT_AES_256
-            if owner_pass or user_pass:
-                encryption = fitz.PDF_ENCRYPT_AES_256
-            else:
-                encryption = fitz.PDF_ENCRYPT_KEEP
-            
-            # Get Boolean and String tuple as result
-            result =  self.pdf_object.save_file(output_file, 
-                                                garbage=garbage, 
-                                                clean=clean, 
-                                                deflate=deflate, 
-                                                deflate_images=deflate_images, 
-                                                deflate_fonts=deflate_fonts, 
-                                                owner_pass=owner_pass, 
-                                                user_pass=user_pass, 
-                                                encryption=encryption)
-            
-            # if Boolean result is True Show Success Message
-            if result[0]:
-                showinfo("Success", f"PDF file saved successfully as {Path(output_file).name}")
-                self.is_changed = False
-                self.status_manager()
+        def split_done(report):
+            message = f"{len(report['outputs'])} files written to {Path(output_dir).name} in {report['seconds']:.1f} s."
+            if report["oversized"]:
+                pages = ", ".join(str(output["range"][0]) for output in report["oversized"][:10])
+                more = f" and {len(report['oversized']) - 10} more" if len(report["oversized"]) > 10 else ""
+                message += f"\nPages {pages}{more} are larger than {max_size} MB on their own and were written as single page files."
+            showinfo("Success", message)
+
+        self.run_task("Splitting", lambda cancel, progress: self.pdf_object.split_pdf_by_size(
+            int(max_size * 1024 * 1024), output_dir, cancel=cancel, progress=progress), split_done, "Failed to split PDF file.")
+
+    # Compress Menu Label of a Preset, With its Projected Size and Time Once Estimated
+    def compress_label(self, name, estimate=None):
+        dpi = COMPRESS_PRESETS[name]["dpi"]
+        label = f"{name.title()} ({dpi} dpi)" if dpi else f"{name.title()} (full resolution)"
+        if estimate is None:
+            return label
+        if estimate == "pending":
+            return f"{label} - estimating..."
+        return f"{label} - about {estimate['bytes'] / 1024 / 1024:.1f} MB in {estimate['seconds']:.0f} s"
+
+    # Start an Estimate When the Compress Menu Opens on a Document State Without one
+    def refresh_compress_menu(self):
+        stamp = (self.pdf_object, self.num_pages, self.pdf_object.pdf_document.xref_length())
+        if stamp != self.compress_estimate_stamp:
+            self.compress_estimate_stamp = stamp
+            self.compress_estimate = None
+            result = []
+            thread = threading.Thread(target=lambda: result.append(self.pdf_object.estimate_compression()), daemon=True)
+            thread.start()
+            self.root.after(100, self.poll_compress_estimate, stamp, thread, result)
+
+        for index, name in enumerate(COMPRESS_PRESETS):
+            estimate = self.compress_estimate["presets"][name] if self.compress_estimate else "pending"
+            self.compress_menu.entryconfig(index, label=self.compress_label(name, estimate))
+
+    # Relabel the Compress Menu Once the Background Estimate Finished, Unless the Document Changed Meanwhile
+    def poll_compress_estimate(self, stamp, thread, result):
+        if thread.is_alive():
+            self.root.after(100, self.poll_compress_estimate, stamp, thread, result)
+            return
+        if stamp != self.compress_estimate_stamp:
+            return
+
+        # A failed estimate leaves the plain labels
+        for index, name in enumerate(COMPRESS_PRESETS):
+            estimate = result[0]["presets"][name] if result else None
+            self.compress_menu.entryconfig(index, label=self.compress_label(name, estimate))
+        if result:
+            self.compress_estimate = result[0]
+
+    # Compress PDF File
+    def compress_pdf(self, preset="ebook"):
+        output_file = asksaveasfilename(title="Save Compressed PDF", filetypes=[("PDF Files", "*.pdf")],
+                                        initialfile=f"{Path(self.pdf_object.file_path).stem}_compressed.pdf")
+        if not output_file:
+            return
+
+        # IF file name not ending with PDF then Set
+        if not output_file.endswith(".pdf"):
+            output_file += ".pdf"
+        if Path(output_file).resolve() == Path(self.pdf_object.file_path).resolve():
+            showerror("Error", "Please do not try to overwrite Source file.")
+            return
+
+        def compress_done(report):
+            recompressed = sum(image["after"] < image["before"] for image in report["images"])
+            showinfo("Success", f"PDF file saved successfully as {Path(output_file).name}\n"
+                                f"{report['bytes_before'] / 1024 / 1024:.1f} MB -> {report['bytes_after'] / 1024 / 1024:.1f} MB, "
+                                f"{recompressed} of {len(report['images'])} images recompressed, "
+                                f"{report['dedup']['duplicates']} duplicate objects removed "
+                                f"({report['dedup']['bytes_saved'] / 1024:.0f} KB).")
+            self.is_changed = False
+
+        self.run_task("Compressing", lambda cancel, progress: self.pdf_object.compress_to(
+            output_file, cancel=cancel, progress=progress, **COMPRESS_PRESETS[preset]), compress_done, "Failed to compress PDF file.")
+    
+    # Export Pages as PNG, JPEG or TIFF Images, Unsaved Changes Included
+    def export_page_images(self):
+        pages = StringVar(value=f"1-{self.num_pages}")
+        dpi = StringVar(value="150")
+        colorspace = StringVar(value="rgb")
+        image_format = StringVar(value="png")
+        settings = {}
+
+        def submit(event=None):
+            try:
+                settings["page_numbers"] = [page_number - 1 for first, last in parse_page_ranges(pages.get(), self.num_pages)
+                                            for page_number in range(first, last + 1)]
+                settings["dpi"] = int(dpi.get())
+                if not 18 <= settings["dpi"] <= 1200:
+                    raise ValueError("DPI must be between 18 and 1200.")
+                if image_format.get() == "jpeg" and colorspace.get() == "bilevel":
+                    raise ValueError("JPEG cannot store black and white images, use PNG or TIFF.")
+            except ValueError as e:
+                settings.clear()
+                showerror("Error", str(e))
                 return
-            
-            # If Save Failed
-            else:
+            settings.update(colorspace=colorspace.get(), image_format=image_format.get())
+            export_popup.destroy()
 
-                # check the error message in result tuple is save to original must be incremental
-                # Then show error message as Please do not try to overwrite Source file.
-                if result[1] == "save to original must be incremental":
-                    showerror("Error", "Please do not try to overwrite Source file.")
-                    
-                else:
-                    showerror("Error", "Failed to save PDF file.")
-                self.is_changed = True
-                self.status_manager()
+        def cancel(event=None):
+            export_popup.destroy()
+
+        export_popup = Toplevel(self.root)
+        export_popup.attributes('-topmost', True)
+        export_popup.title("Export Pages as Images")
+
+        pages_label = Label(export_popup, text=f"Pages (e.g. 1-3,5) Last Page is {self.num_pages}:")
+        pages_label.grid(row=0, column=0, padx=5, pady=5)
+        pages_entry = Entry(export_popup, textvariable=pages)
+        pages_entry.grid(row=0, column=1, padx=5, pady=5)
+        pages_entry.focus()
+
+        dpi_label = Label(export_popup, text="DPI:")
+        dpi_label.grid(row=1, column=0, padx=5, pady=5)
+        dpi_entry = Entry(export_popup, textvariable=dpi)
+        dpi_entry.grid(row=1, column=1, padx=5, pady=5)
+
+        colorspace_label = Label(export_popup, text="Colour:")
+        colorspace_label.grid(row=2, column=0, padx=5, pady=5)
+        colorspace_box = ttk.Combobox(export_popup, textvariable=colorspace, values=("rgb", "gray", "bilevel"), state="readonly")
+        colorspace_box.grid(row=2, column=1, padx=5, pady=5)
+
+        format_label = Label(export_popup, text="Format:")
+        format_label.grid(row=3, column=0, padx=5, pady=5)
+        format_box = ttk.Combobox(export_popup, textvariable=image_format, values=tuple(RASTER_FORMATS), state="readonly")
+        format_box.grid(row=3, column=1, padx=5, pady=5)
+
+        export_submit_button = Button(export_popup, text="Export", command=submit)
+        export_submit_button.grid(row=4, column=0, padx=5, pady=10)
+        export_cancel_button = Button(export_popup, text="Cancel", command=cancel)
+        export_cancel_button.grid(row=4, column=1, padx=5, pady=10)
+
+        export_popup.bind('<Return>', submit)
+        export_popup.bind('<Escape>', cancel)
+
+        export_popup.grab_set()
+        export_popup.wait_window()
+        if not settings:
+            return
+
+        # Images are named like file_001.png
+        output_dir = askdirectory(title="Export Into Folder", initialdir=str(Path(self.pdf_object.file_path).parent))
+        if not output_dir:
+            return
+
+        def export_done(report):
+            showinfo("Success", f"{report['pages']} images written to {Path(output_dir).name} in {report['seconds']:.1f} s "
+                                f"({report['bytes'] / 1024 / 1024:.1f} MB).")
+
+        self.run_task("Exporting", lambda cancel, progress: self.pdf_object.rasterize(output_dir, cancel=cancel, progress=progress, **settings),
+                      export_done, "Failed to export pages.")
+
+    # Extract Embedded Images in Their Stored Encoding, With a Manifest of the Pages They Appear on
+    def export_embedded_images(self):
+        if not self.pdf_object.is_image_available:
+            showinfo("Export", "The document has no embedded images.")
+            return
+
+        output_dir = askdirectory(title="Extract Images Into Folder", initialdir=str(Path(self.pdf_object.file_path).parent))
+        if not output_dir:
+            return
+
+        def export_done(report):
+            message = (f"{report['images_written']} images written to {Path(output_dir).name} in {report['seconds']:.1f} s "
+                       f"({report['bytes'] / 1024 / 1024:.1f} MB), {report['duplicates']} duplicates skipped.\n")
+            if report["images_unreadable"]:
+                message += f"{report['images_unreadable']} images could not be read and were left out.\n"
+            showinfo("Success", message + "Pages of each image are listed in manifest.json.")
+
+        self.run_task("Extracting Images", lambda cancel, progress: self.pdf_object.extract_images(output_dir, cancel=cancel, progress=progress),
+                      export_done, "Failed to extract images.")
+
+    # Save PDF File in the Background, on_saved is Called Once it Succeeded
+    def save_pdf(self,
+                output_file=None,
+                 garbage=0, 
+                 clean=False, 
+                 deflate=False, 
+                 deflate_images=False, 
+                 deflate_fonts=False, 
+                 owner_pass=None, 
+                 user_pass=None, 
+                 initial_file=None,
+                 on_saved=None):
+
+        # Plain saves can go back into the open file, appending only what changed
+        if self.incremental_save.get() and not (output_file or owner_pass or user_pass):
+            self.save_pdf_in_place(on_saved)
+            return
+
+        if output_file:
+            output_file = str(Path(self.pdf_object.file_path).parent / output_file)
+        else:
+
+            # Get Output File
+            output_file = asksaveasfilename(title="Save PDF", filetypes=[("PDF Files", "*.pdf")], initialfile=initial_file)
+        
+
+        if output_file:
+
+            # IF file name not ending with PDF then Set
+            if not output_file.endswith(".pdf"):
+                output_file += ".pdf"
+
+            # The worker reads the source file while it writes, so it cannot be the output
+            if Path(output_file).resolve() == Path(self.pdf_object.file_path).resolve():
+                showerror("Error", "Please do not try to overwrite Source file.")
                 return
+
+            # If owner or user password set then set encryption as fitz.PDF_ENCRYPT_AES_256
+            if owner_pass or user_pass:
+                encryption = fitz.PDF_ENCRYPT_AES_256
+            else:
+                encryption = fitz.PDF_ENCRYPT_KEEP
+
+            def save_done(report):
+                showinfo("Success", f"PDF file saved successfully as {Path(output_file).name}")
+                self.is_changed = False
+                if on_saved:
+                    on_saved()
+
+            # Written to a temp file in a worker process, a cancel or failure leaves the output untouched
+            self.run_task("Saving", lambda cancel, progress: self.pdf_object.save_to(output_file, cancel, progress,
+                                                                                     owner_pass=owner_pass,
+                                                                                     user_pass=user_pass,
+                                                                                     garbage=garbage,
+                                                                                     clean=clean,
+                                                                                     deflate=deflate,
+                                                                                     deflate_images=deflate_images,
+                                                                                     deflate_fonts=deflate_fonts,
+                                                                                     encryption=encryption),
+                          save_done, "Failed to save PDF file.")
+            return
             
         self.is_changed = False
         self.status_manager()
+        if on_saved:
+            on_saved()
+
+    # Save Changes Into the Open File, Incrementally Unless it Needs Compacting, See PDFManager.save_in_place
+    def save_pdf_in_place(self, on_saved=None):
+        def save_done(report):
+            self.is_changed = False
+
+            # A compacting save renumbers objects, and thumbnails and the search index are keyed by page xref
+            if report["mode"] == "full":
+                self.thumbnail_loader.cancel()
+                self.thumbnail_cache.clear()
+                self.layout_thumbnails()
+                self.start_search_index()
+            else:
+                # Merged pages are part of the file now, and the file has a new content hash
+                self.search_dirty = True
+                self.save_search_index()
+            if on_saved:
+                on_saved()
+
+        self.run_task("Saving", lambda cancel, progress: self.pdf_object.save_in_place(cancel, progress),
+                      save_done, "Failed to save PDF file.")
 
     # About Menu
     def about_prog(self):
@@ -674,18 +1783,57 @@ class GUI:
 
     # Quit Program
     def quit_prog(self):
-        self.close_pdf()
-        if not self.is_changed:
-            self.root.destroy()
+        self.close_pdf(then=self.root.destroy)
 
 
 class PDFManager:
     def __init__(self):
         self.pdf_document = None
-        self.temp_document = None
+
+        # MuPDF documents are not thread safe, background renderers take this lock
+        self.lock = threading.RLock()
+
+        self.file_path = None
+        self.password = None
+        self._content_hash = None
+        self.original_xref_count = 0
+        self.file_versions = 0
+        self.disk_cacheable = False
+        self.history = PageHistory()
+        self.flat_page_tree = False
+
+        # Content index built by a worker process, and those of merged files still being built
+        self._index = None
+        self.index_future = None
+        self.pending_indexes = []
+
+        # True once pages were deleted or merged, the file on disk no longer matches the document
+        self.modified = False
+
+        # Objects below deduplicated_xrefs were already checked for duplicates
+        self.deduplicator = ObjectDeduplicator()
+        self.deduplicated_xrefs = 1
 
     def load_pdf(self, file_path):
         self.pdf_document = fitz.open(file_path)
+        self.file_path = file_path
+        self._content_hash = None
+
+        # Objects below this xref come from the file on disk, later ones from edits
+        self.original_xref_count = self.pdf_document.xref_length()
+
+        # The original plus one per incremental update appended to the file
+        self.file_versions = self.pdf_document.version_count
+
+        # Undo steps and the content index hold page xrefs, which only stay valid within one opening
+        self.history = PageHistory()
+        self.flat_page_tree = False
+        self._index = None
+        self.index_future = None
+        self.pending_indexes = []
+
+        # Never write derived data of password protected files to disk
+        self.disk_cacheable = not self.pdf_document.needs_pass
 
     @property
     def get_page_count(self):
@@ -703,31 +1851,326 @@ class PDFManager:
     def need_password(self):
         return self.pdf_document.needs_pass
 
+    # Hash of the Source File Contents, Computed Once on First Use
+    @property
+    def content_hash(self):
+        if self._content_hash is None:
+            self._content_hash = file_digest(self.file_path)
+        return self._content_hash
+
     @property
     def is_image_available(self):
-        for page_number in range(self.get_page_count):
-            image_list = self.pdf_document.get_page_images(page_number, full=True)
-            if image_list:
-                return True
-            return False
+        index = self.index
+        has_images = index.has_images(self.get_page_xrefs()) if index else None
+        if has_images is not None:
+            return has_images
+
+        with self.lock:
+            return any(self.pdf_document.get_page_images(page_number, full=True) for page_number in range(self.get_page_count))
+
+    # Build the Content Index in a Worker Process, Call Once the Document is Open and Decrypted
+    def start_index(self):
+        self._index = None
+        self.pending_indexes = []
+        self.index_future = submit_index(self.file_path, self.password)
+
+    # Content Index Once the Worker Finished, None Until Then or if it Failed
+    @property
+    def index(self):
+        with self.lock:
+            if self.index_future is not None and self.index_future.done():
+                try:
+                    self._index = DocumentIndex(self.index_future.result())
+                except Exception:
+                    logger.warning("Could not index %s, queries scan the pages instead", self.file_path, exc_info=True)
+                self.index_future = None
+
+            # Merged files are added as their indexes arrive, pages the index lacks make the queries fall back
+            if self._index is not None:
+                for future, page_xrefs in [pending for pending in self.pending_indexes if pending[0].done()]:
+                    self.pending_indexes.remove((future, page_xrefs))
+                    try:
+                        self._index.add_pages(DocumentIndex(future.result()), page_xrefs)
+                    except Exception:
+                        logger.warning("Could not index a merged file, queries scan its pages instead", exc_info=True)
+            return self._index
 
     def decrypt_pdf(self, password):
-        return self.pdf_document.authenticate(password)
+        # Kept so worker processes can open the file themselves
+        if self.pdf_document.authenticate(password):
+            self.password = password
+            return True
+        return False
     
     def get_page(self, page_number):
         return self.pdf_document[page_number]
     
+    def get_page_rotation(self, page_number):
+        with self.lock:
+            return self.pdf_document[page_number].rotation
+
+    def get_page_sizes(self):
+        with self.lock:
+            return [(page.rect.width, page.rect.height) for page in self.pdf_document]
+
+    def get_page_size(self, page_number):
+        with self.lock:
+            rect = self.pdf_document[page_number].rect
+            return rect.width, rect.height
+
+    def get_page_xref(self, page_number):
+        with self.lock:
+            return self.pdf_document.page_xref(page_number)
+
+    # Page Xrefs in Page Order for Queries, Never Flattens the Page Tree, See page_tree
+    def get_page_xrefs(self):
+        with self.lock:
+            if self.flat_page_tree:
+                return self.page_tree()[1]
+            return [self.pdf_document.page_xref(page_number) for page_number in range(self.pdf_document.page_count)]
+
+    # Normalised Words of a Page in Reading Order With Their Boxes as the Rotated Page Shows Them
+    def get_page_words(self, page_number):
+        with self.lock:
+            page = self.pdf_document[page_number]
+            matrix = page.rotation_matrix
+            words = []
+            for x0, y0, x1, y1, text, *_ in page.get_text("words", sort=True):
+                for word in search_terms(text):
+                    rect = fitz.Rect(x0, y0, x1, y1) * matrix
+                    words.append((word, (round(rect.x0, 1), round(rect.y0, 1), round(rect.x1, 1), round(rect.y1, 1))))
+            return words
+
+    def render_page(self, page_number, scale=1.0, draft=False):
+        with self.lock:
+            page = self.pdf_document[page_number]
+            if not draft:
+                return page_pixmap(page, scale)
+
+            # Anti-aliasing is global in MuPDF, every render holds this lock so restoring it here is enough
+            aa_level = fitz.TOOLS.show_aa_level()["graphics"]
+            fitz.TOOLS.set_aa_level(0)
+            try:
+                return page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False, annots=False)
+            finally:
+                fitz.TOOLS.set_aa_level(aa_level)
+
+    def render_clip(self, page_number, scale, clip):
+        with self.lock:
+            return self.pdf_document[page_number].get_pixmap(matrix=fitz.Matrix(scale, scale), clip=clip, alpha=False)
+
+    def render_thumbnail(self, page_number, box):
+        with self.lock:
+            page = self.pdf_document[page_number]
+            scale = min(box[0] / page.rect.width, box[1] / page.rect.height)
+            return page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False)
+
     def delete_page_no(self, page_number):
-        self.pdf_document.delete_page(page_number)
+        with self.lock:
+            self.edit_pages(("delete", page_number, self.pdf_document.page_xref(page_number)))
+
+    # Move a Page so it Ends up at target, Both 0 Based
+    def move_page(self, source, target):
+        with self.lock:
+            self.edit_pages(("move", source, target))
 
     def merge_pdf(self, pdf_doc, at_end):
-        if at_end:
-            self.pdf_document.insert_pdf(pdf_doc.pdf_document)
-        else:
-            self.pdf_document.insert_pdf(pdf_doc.pdf_document, start_at=0)
+        with self.lock:
+            # Inserted pages join the flat page tree the undo steps rely on
+            self.page_tree()
+            start = self.pdf_document.page_count if at_end else 0
+
+            # Objects already in the document are only looked up, the merged ones fold into them
+            first_new = self.pdf_document.xref_length()
+            if self.deduplicated_xrefs < first_new:
+                self.deduplicator.index_existing(self.pdf_document, first_new, self.deduplicated_xrefs)
+                self.deduplicated_xrefs = first_new
+            self.pdf_document.insert_pdf(pdf_doc.pdf_document, start_at=-1 if at_end else 0)
+            xrefs = tuple(self.pdf_document.page_xref(page_number) for page_number in range(start, start + pdf_doc.get_page_count))
+            self.history.record(("insert", start, xrefs))
+            if self.index_future or self._index:
+                self.pending_indexes.append((submit_index(pdf_doc.file_path, pdf_doc.password), xrefs))
+            self.modified = True
+
+            # What this merge shared, the deduplicator's report counts every merge since opening
+            before = self.deduplicator.report
+            after = self.deduplicate()
+            return {key: after[key] - before[key] for key in after}
+
+    # Root Pages Object and the Page Xrefs in its Kids Array, Flattening a Nested Page Tree First, Only Edits Call it
+    def page_tree(self):
+        with self.lock:
+            doc = self.pdf_document
+            pages_xref = int(PDF_REFERENCE.search(doc.xref_get_key(doc.pdf_catalog(), "Pages")[1]).group(1))
+            kids = [int(xref) for xref in PDF_REFERENCE.findall(doc.xref_get_key(pages_xref, "Kids")[1])]
+
+            # A root with one kid per page is flat already, otherwise select() rebuilds the tree with one
+            # level and copies inherited attributes onto the pages, which takes seconds on large files
+            if not self.flat_page_tree and len(kids) != doc.page_count:
+                doc.select(range(doc.page_count))
+                return self.page_tree()
+            self.flat_page_tree = True
+            return pages_xref, kids
+
+    # Write a New Page Order, Pages of added_xrefs Were Deleted or Undone and Rejoin the Tree
+    def write_page_tree(self, pages_xref, order, added_xrefs=()):
+        with self.lock:
+            doc = self.pdf_document
+            doc.xref_set_key(pages_xref, "Kids", "[" + " ".join(f"{xref} 0 R" for xref in order) + "]")
+            doc.xref_set_key(pages_xref, "Count", str(len(order)))
+            for xref in added_xrefs:
+                doc.xref_set_key(xref, "Parent", f"{pages_xref} 0 R")
+            self.modified = True
+
+    # Apply One Delete or Move to the Page Tree and Record it for Undo
+    def edit_pages(self, step):
+        with self.lock:
+            pages_xref, order = self.page_tree()
+            PageHistory.apply(order, step)
+            self.write_page_tree(pages_xref, order)
+            self.history.record(step)
+
+    # Undo up to steps Edits at Once, Returns the (step, reverted) Pairs Applied, See PageHistory
+    def undo(self, steps=1):
+        return self._replay(self.history.undo, steps)
+
+    def redo(self, steps=1):
+        return self._replay(self.history.redo, steps)
+
+    def _replay(self, replay, steps):
+        with self.lock:
+            pages_xref, order = self.page_tree()
+            applied = replay(order, steps)
+            if applied:
+                self.write_page_tree(pages_xref, order, PageHistory.added_xrefs(applied))
+            return applied
+
+    # Share One Copy of Fonts, Images and Other Objects Duplicated Since the Last Call
+    def deduplicate(self):
+        with self.lock:
+            self.deduplicator.deduplicate(self.pdf_document, self.deduplicated_xrefs)
+            self.deduplicated_xrefs = self.pdf_document.xref_length()
+        return self.deduplicator.report
 
-    def split_pdf(self, split_range):
-        self.temp_document.insert_pdf(self.pdf_document, from_page=split_range[0] - 1, to_page=split_range[1] - 1)
+    # Write Each 1 Based Range to output_dir in Parallel, See split_file and run_isolated
+    def split_pdf(self, split_ranges, output_dir, workers=None, cancel=None, progress=None):
+        return run_isolated(split_file, self.source, split_ranges, output_dir, Path(self.file_path).stem, workers, self.password,
+                            cancel=cancel, progress=progress)
+
+    # Recompress Embedded Images into output_file, the Open Document is Left as it is, See compress_file and run_isolated
+    def compress_to(self, output_file, workers=None, cancel=None, progress=None, **settings):
+        return run_isolated(compress_file, self.source, output_file, workers, self.password, cancel=cancel, progress=progress,
+                            image_dpi=self.indexed_image_dpi(), **settings)
+
+    # Page Text, Blocks or Words in Page Order From Worker Processes, See iter_page_content
+    def iter_text(self, mode="text", page_numbers=None, workers=None, cancel=None):
+        return iter_page_content(self.source, mode, self.password, page_numbers, workers, cancel=cancel)
+
+    # Stream Page Text, Blocks or Words to a TXT or JSONL File, See export_text and run_isolated
+    def export_text(self, output_file, mode="text", output_format=None, page_numbers=None, workers=None, cancel=None, progress=None):
+        return run_isolated(export_text, self.source, output_file, mode, output_format, self.password, page_numbers, workers,
+                            cancel=cancel, progress=progress)
+
+    # Render Pages to Image Files in Parallel, See rasterize_file and run_isolated
+    def rasterize(self, output_dir, page_numbers=None, dpi=150, colorspace="rgb", image_format="png", quality=90, workers=None,
+                  cancel=None, progress=None):
+        return run_isolated(rasterize_file, self.source, output_dir, Path(self.file_path).stem, page_numbers, dpi, colorspace,
+                            image_format, quality, self.password, workers, cancel=cancel, progress=progress)
+
+    # Extract the Embedded Images of the Current Pages Once Each, See extract_images and run_isolated
+    def extract_images(self, output_dir, workers=None, cancel=None, progress=None):
+        return run_isolated(extract_images, [self.source], output_dir, self.password, [self.file_path], workers,
+                            cancel=cancel, progress=progress)
+
+    # Placed Resolution of the Images on the Current Pages From the Content Index, None Means Scan the Pages
+    def indexed_image_dpi(self):
+        index = self.index
+        return index.image_dpi(self.get_page_xrefs()) if index else None
+
+    # Save the Document to output_file in a Worker Process That a Cancel Can Stop, See save_file_atomic
+    def save_to(self, output_file, cancel=None, progress=None, owner_pass=None, user_pass=None, **options):
+        return save_file_atomic(self.source, output_file, self.password, cancel, progress,
+                                owner_pw=owner_pass, user_pw=user_pass, **options)
+
+    # Projected Size and Time of Each Compress Preset, See estimate_compression and run_isolated
+    def estimate_compression(self, cancel=None, progress=None, **options):
+        return run_isolated(estimate_compression, self.source, self.password, image_dpi=self.indexed_image_dpi(),
+                            cancel=cancel, progress=progress, **options)
+
+    # Save Back to the Source File, Appending Only the Changed Objects While That Keeps the File Compact
+    def save_in_place(self, cancel=None, progress=None, max_versions=8, max_growth=0.1):
+        """An incremental save appends the objects added or changed since loading to the end of the
+        file, so deleting a page writes a new page tree and nothing else. Objects of deleted pages
+        stay in the file, so once it holds max_versions updates, when the added objects would grow
+        it by more than max_growth, or when MuPDF cannot append to it, the whole document is
+        compacted into a temp file instead, which then replaces the source and is reopened."""
+        start = time.perf_counter()
+        bytes_before = os.path.getsize(self.file_path)
+        with self.lock:
+            doc = self.pdf_document
+            added = 0
+            for xref in range(self.original_xref_count, doc.xref_length()):
+                try:
+                    added += stored_object_size(doc, xref)
+                except RuntimeError:
+                    pass  # Free entry left by an insert
+            incremental = doc.can_save_incrementally() and self.file_versions < max_versions and added <= max_growth * bytes_before
+            if incremental:
+                check_cancelled(cancel)
+                doc.saveIncr()
+                self.file_versions += 1
+
+        if not incremental:
+            compact_file = f"{self.file_path}.compact"
+            save_file_atomic(self.source, compact_file, self.password, cancel, progress, garbage=3, deflate=True)
+
+            # Windows cannot replace a file that is still open, and object numbers change, so deduplication starts over
+            with self.lock:
+                self.pdf_document.close()
+                try:
+                    os.replace(compact_file, self.file_path)
+                except OSError:
+                    # The compacted copy holds the edits, keep working from it
+                    self.load_pdf(compact_file)
+                    raise
+                self.load_pdf(self.file_path)
+                if self.password:
+                    self.pdf_document.authenticate(self.password)
+                self.deduplicator = ObjectDeduplicator()
+                self.deduplicated_xrefs = self.pdf_document.xref_length()
+                self.start_index()
+
+        # The file on disk matches the document again
+        with self.lock:
+            self.original_xref_count = self.pdf_document.xref_length()
+            self.modified = False
+            self._content_hash = None
+        bytes_after = os.path.getsize(self.file_path)
+        return {"mode": "incremental" if incremental else "full", "bytes_before": bytes_before, "bytes_after": bytes_after,
+                "bytes_written": bytes_after - bytes_before if incremental else bytes_after,
+                "seconds": time.perf_counter() - start}
+
+    # Path of the Document on Disk, or its Bytes Once Edited, for Worker Processes to Open
+    @property
+    def source(self):
+        if self.modified:
+            with self.lock:
+                return self.pdf_document.tobytes()
+        return self.file_path
+
+    # Objects Reachable From Each Page and the Object Sizes From the Content Index, None Unless it Covers Every Page
+    def indexed_page_objects(self):
+        with self.lock:
+            index = self.index
+            page_xrefs = self.get_page_xrefs()
+            if index and index.covers_objects(page_xrefs):
+                return [index.pages[xref]["objects"] for xref in page_xrefs], index.sizes
+            return None
+
+    # Split into the Fewest Consecutive Parts That Stay Under max_bytes, See split_file_by_size and run_isolated
+    def split_pdf_by_size(self, max_bytes, output_dir, workers=None, passes=3, cancel=None, progress=None):
+        return run_isolated(split_file_by_size, self.source, max_bytes, output_dir, Path(self.file_path).stem, workers,
+                            self.password, passes, self.indexed_page_objects(), cancel=cancel, progress=progress)
         
     def save_file(self, output_file, 
                   garbage=0, 
@@ -753,8 +2196,2070 @@ class PDFManager:
             return False, str(e)
     
 
+class RenderCache:
+    """LRU cache of rendered page bitmaps bounded by a byte budget.
+
+    Keys are tuples starting with the page number, so page deletes and inserts
+    can re-key the entries of the pages that move instead of dropping them.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value, size):
+        if key in self.entries:
+            self.current_bytes -= self.entries.pop(key)[1]
+
+        # Never let a single bitmap flush the whole cache
+        if size > self.max_bytes:
+            return
+        self.entries[key] = (value, size)
+        self.current_bytes += size
+
+        # Evict least recently used bitmaps until back under budget
+        while self.current_bytes > self.max_bytes:
+            _, (_, old_size) = self.entries.popitem(last=False)
+            self.current_bytes -= old_size
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.current_bytes = 0
+
+    # Whole page bitmap of the page at the zoom nearest to the given one, without touching the counters
+    def closest(self, page_number, zoom, rotation):
+        best = None
+        for key, (value, size) in self.entries.items():
+            if len(key) == 3 and key[0] == page_number and key[2] == rotation:
+                if best is None or abs(key[1] - zoom) < abs(best[0] - zoom):
+                    best = (key[1], value)
+        return best[1] if best else None
+
+    def _rekey(self, new_page):
+        entries = OrderedDict()
+        self.current_bytes = 0
+        for key, (value, size) in self.entries.items():
+            page_number = new_page(key[0])
+            if page_number is not None:
+                entries[(page_number,) + key[1:]] = (value, size)
+                self.current_bytes += size
+        self.entries = entries
+
+    def remove_page(self, page_number):
+        self.remove_pages(page_number, 1)
+
+    def remove_pages(self, start, count):
+        self._rekey(lambda n: None if start <= n < start + count else n - count if n >= start + count else n)
+
+    def insert_pages(self, start, count):
+        self._rekey(lambda n: n + count if n >= start else n)
+
+    def move_page(self, source, target):
+        def new_page(n):
+            if n == source:
+                return target
+            if source < n <= target:
+                return n - 1
+            if target <= n < source:
+                return n + 1
+            return n
+        self._rekey(new_page)
+
+    # Follow the Pages an Undo or Redo Moved, See PageHistory.page_changes
+    def apply_page_changes(self, applied):
+        for step, reverted in applied:
+            kind, start, count = PageHistory.page_changes(step, reverted)
+            if kind == "remove":
+                self.remove_pages(start, count)
+            elif kind == "insert":
+                self.insert_pages(start, count)
+            else:
+                self.move_page(start, count)
+
+    @property
+    def stats(self):
+        return {"entries": len(self.entries), "bytes": self.current_bytes, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class PageHistory:
+    """Undo and redo of page deletes, moves and inserts as edits of the page order.
+
+    The page tree is flattened once into a single Kids array, after which every edit
+    only rewrites that array. Deleted pages and undone inserts keep their objects in
+    the document until a compacting save, so a step records positions and xrefs and
+    never a copy of the pages: ("delete", index, xref) and ("move", source, target)
+    take a few integers, ("insert", start, xrefs) one xref per inserted page.
+    """
+
+    def __init__(self, max_steps=1000):
+        self.undo_steps = deque(maxlen=max_steps)
+        self.redo_steps = []
+
+    def __len__(self):
+        return len(self.undo_steps)
+
+    @property
+    def can_undo(self):
+        return bool(self.undo_steps)
+
+    @property
+    def can_redo(self):
+        return bool(self.redo_steps)
+
+    def record(self, step):
+        self.undo_steps.append(step)
+        self.redo_steps.clear()
+
+    def clear(self):
+        self.undo_steps.clear()
+        self.redo_steps.clear()
+
+    # Revert up to steps Edits on the Page Order List, Latest First
+    def undo(self, order, steps=1):
+        applied = []
+        while self.undo_steps and len(applied) < steps:
+            step = self.undo_steps.pop()
+            self.apply(order, step, revert=True)
+            self.redo_steps.append(step)
+            applied.append((step, True))
+        return applied
+
+    def redo(self, order, steps=1):
+        applied = []
+        while self.redo_steps and len(applied) < steps:
+            step = self.redo_steps.pop()
+            self.apply(order, step)
+            self.undo_steps.append(step)
+            applied.append((step, False))
+        return applied
+
+    @staticmethod
+    def apply(order, step, revert=False):
+        kind = step[0]
+        if kind == "delete":
+            if revert:
+                order.insert(step[1], step[2])
+            else:
+                del order[step[1]]
+        elif kind == "move":
+            source, target = (step[2], step[1]) if revert else (step[1], step[2])
+            order.insert(target, order.pop(source))
+        elif kind == "insert":
+            if revert:
+                del order[step[1]:step[1] + len(step[2])]
+            else:
+                order[step[1]:step[1]] = step[2]
+
+    # Pages That Rejoin the Tree, Their Parent is Set Again in Case a Save Dropped it
+    @staticmethod
+    def added_xrefs(applied):
+        xrefs = []
+        for step, reverted in applied:
+            if step[0] == "delete" and reverted:
+                xrefs.append(step[2])
+            elif step[0] == "insert" and not reverted:
+                xrefs.extend(step[2])
+        return xrefs
+
+    # What a Step Did to Page Numbers, as ("remove", start, count), ("insert", start, count) or ("move", source, target)
+    @staticmethod
+    def page_changes(step, reverted):
+        kind = step[0]
+        if kind == "move":
+            return ("move", step[2], step[1]) if reverted else ("move", step[1], step[2])
+        count = 1 if kind == "delete" else len(step[2])
+        removes = (kind == "delete") != reverted
+        return "remove" if removes else "insert", step[1], count
+
+
+class PagePrefetcher:
+    """Renders queued pages on a background thread and hands them to the Tk thread.
+
+    Rendered pixmaps are polled from a queue with root.after, so Tk is only
+    touched from its own thread. A new submit replaces the pending jobs and
+    cancel() discards renders that finish after the document changed.
+    """
+
+    def __init__(self, root, on_rendered, radius=2, max_bytes=64 * 1024 * 1024, poll_ms=30):
+        self.root = root
+        self.on_rendered = on_rendered
+        self.radius = radius
+        self.max_bytes = max_bytes
+        self.poll_ms = poll_ms
+        self.pdf_object = None
+        self.jobs = deque()
+        self.results = queue.Queue()
+        self.condition = threading.Condition()
+        self.generation = 0
+        self.active = False
+        self.polling = False
+        self.thread = None
+
+    def submit(self, pdf_object, jobs):
+        with self.condition:
+            self.pdf_object = pdf_object
+            self.jobs = deque(jobs)
+            self.condition.notify()
+
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        if jobs and not self.polling:
+            self.polling = True
+            self.root.after(self.poll_ms, self._poll)
+
+    def cancel(self):
+        with self.condition:
+            self.jobs.clear()
+            self.generation += 1
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.jobs:
+                    self.condition.wait()
+                key, page_number, scale = self.jobs.popleft()
+                generation = self.generation
+                pdf_object = self.pdf_object
+                self.active = True
+            try:
+                self.results.put((generation, key, self.render(pdf_object, key, page_number, scale)))
+            except Exception:
+                # The page went away while it was queued
+                pass
+            finally:
+                self.active = False
+
+    # Runs on the worker thread, the pixmap itself is handed over so its samples are never copied here
+    def render(self, pdf_object, key, page_number, scale):
+        return pdf_object.render_page(page_number, scale)
+
+    # Runs on the Tk thread
+    def _poll(self):
+        while not self.results.empty():
+            generation, key, pix = self.results.get_nowait()
+            if generation == self.generation:
+                self.on_rendered(key, pix)
+
+        if self.jobs or self.active or not self.results.empty():
+            self.root.after(self.poll_ms, self._poll)
+        else:
+            self.polling = False
+
+
+class TileRenderer(PagePrefetcher):
+    """Renders fixed size tiles of a zoomed page, keys end with the tile column and row."""
+
+    def __init__(self, root, on_rendered, tile_size):
+        super().__init__(root, on_rendered)
+        self.tile_size = tile_size
+
+    def render(self, pdf_object, key, page_number, scale):
+        column, row = key[-2:]
+        step = self.tile_size / scale
+        clip = fitz.Rect(column * step, row * step, (column + 1) * step, (row + 1) * step)
+        return pdf_object.render_clip(page_number, scale, clip)
+
+
+class ThumbnailLoader(PagePrefetcher):
+    """Loads low resolution thumbnails from the disk cache or renders and stores them."""
+
+    def __init__(self, root, on_rendered, disk_cache, box):
+        super().__init__(root, on_rendered)
+        self.disk_cache = disk_cache
+        self.box = box
+
+    def render(self, pdf_object, key, page_number, scale):
+        xref = key[0]
+
+        # The page moved while queued, the strip asks again for what is in view
+        if pdf_object.get_page_xref(page_number) != xref:
+            raise IndexError(page_number)
+
+        name = None
+        if pdf_object.disk_cacheable and xref < pdf_object.original_xref_count:
+            name = f"{pdf_object.content_hash}-{xref}-{self.box[0]}x{self.box[1]}.png"
+            data = self.disk_cache.get(name)
+            if data:
+                return fitz.Pixmap(data)
+
+        pix = pdf_object.render_thumbnail(page_number, self.box)
+        if name:
+            self.disk_cache.put(name, pix.tobytes("png"))
+        return pix
+
+
+class TextIndexer(PagePrefetcher):
+    """Extracts the words of queued pages for the search index, keys are (page xref,)."""
+
+    def render(self, pdf_object, key, page_number, scale):
+        # The page moved while queued, the missing pages are queued again after edits
+        if pdf_object.get_page_xref(page_number) != key[0]:
+            raise IndexError(page_number)
+        return pdf_object.get_page_words(page_number)
+
+
+class ThumbnailDiskCache:
+    """Directory of PNG thumbnails evicted oldest-used first by total size."""
+
+    def __init__(self, directory, max_bytes=200 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.current_bytes = None
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        path = self.directory / name
+        try:
+            data = path.read_bytes()
+            os.utime(path)  # Mark as recently used for eviction
+        except OSError:
+            return None
+        return data
+
+    def put(self, name, data):
+        path = self.directory / name
+        temp_path = path.with_name(path.name + ".tmp")
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            temp_path.write_bytes(data)
+            os.replace(temp_path, path)
+        except OSError:
+            return
+
+        # The directory is scanned once, then kept up to date with the writes
+        with self.lock:
+            if self.current_bytes is not None:
+                self.current_bytes += len(data)
+            over_budget = self.current_bytes is None or self.current_bytes > self.max_bytes
+        if over_budget:
+            self.trim()
+
+    def trim(self):
+        with self.lock:
+            files = []
+            for path in self.directory.glob("*.png"):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files, key=lambda item: item[0]):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    path.unlink()
+                    total -= size
+                except OSError:
+                    pass
+            self.current_bytes = total
+
+
+class BackgroundTask:
+    """Runs one save, split or compress on a worker thread behind a progress window with a Cancel button.
+
+    The function gets a cancel event and a progress(fraction, text) callback. Progress is only
+    stored by the worker and shown by polling with root.after, so Tk is only touched from its
+    own thread, and on_finished(result, error) is called there once the function returns.
+    """
+
+    def __init__(self, root, title, function, on_finished, poll_ms=100):
+        self.root = root
+        self.title = title
+        self.on_finished = on_finished
+        self.poll_ms = poll_ms
+        self.cancel_event = threading.Event()
+        self.state = (0.0, "")
+        self.result = None
+        self.error = None
+        self.start = time.perf_counter()
+
+        self.window = Toplevel(root)
+        self.window.title(title)
+        self.window.resizable(False, False)
+        self.window.transient(root)
+        self.window.protocol("WM_DELETE_WINDOW", self.cancel)
+        self.status_label = Label(self.window, text=f"{title}...", width=40)
+        self.status_label.pack(padx=10, pady=5)
+        self.progressbar = ttk.Progressbar(self.window, length=300, maximum=100)
+        self.progressbar.pack(padx=10, pady=5)
+        self.cancel_button = Button(self.window, text="Cancel", command=self.cancel)
+        self.cancel_button.pack(pady=10)
+
+        self.thread = threading.Thread(target=self._run, args=(function,), daemon=True)
+        self.thread.start()
+        self.root.after(self.poll_ms, self._poll)
+
+    @property
+    def running(self):
+        return self.thread.is_alive()
+
+    def cancel(self):
+        self.cancel_event.set()
+        self.cancel_button.config(state=DISABLED)
+        self.status_label.config(text="Cancelling...")
+
+    # Runs on the worker thread
+    def _run(self, function):
+        try:
+            self.result = function(self.cancel_event, self.report_progress)
+        except Exception as e:
+            self.error = e
+
+    def report_progress(self, fraction, text=""):
+        self.state = (fraction, text)
+
+    # Runs on the Tk thread
+    def _poll(self):
+        if self.thread.is_alive():
+            fraction, text = self.state
+            self.progressbar["value"] = fraction * 100
+            if not self.cancel_event.is_set():
+                self.status_label.config(text=f"{self.title}: {fraction:.0%} {text} ({time.perf_counter() - self.start:.0f} s)")
+            self.root.after(self.poll_ms, self._poll)
+            return
+
+        self.window.destroy()
+        self.on_finished(self.result, self.error)
+
+
+# Matrix Scale That Keeps a Draft Render Within max_pixels
+def draft_scale(width, height, scale, max_pixels):
+    pixels = width * height * scale * scale
+    return scale if pixels <= max_pixels else scale * math.sqrt(max_pixels / pixels)
+
+
+# Tk Photo Image of an RGB Pixmap With the Fewest Copies of its Samples
+def pixmap_to_photo(pix):
+    # samples_mv is a view of MuPDF's buffer, unlike pix.samples which copies it into bytes.
+    # PIL unpacks it once into its own storage and PhotoImage copies that once into Tk.
+    return ImageTk.PhotoImage(Image.frombuffer("RGB", (pix.width, pix.height), pix.samples_mv, "raw", "RGB", 0, 1))
+
+
+# Hash of a File Read in Chunks so Large Documents are not Loaded at Once
+def file_digest(file_path, chunk_size=1024 * 1024):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Parse Page Ranges like 1-3,5,7-9 or "every N" into 1 Based Inclusive Tuples
+def parse_page_ranges(text, page_count):
+    text = text.strip()
+    if text.lower().startswith("every"):
+        try:
+            step = int(text[5:].strip().split()[0])
+        except (ValueError, IndexError):
+            step = 0
+        if step < 1:
+            raise ValueError(f"Invalid split range {text}. (e.g. every 10)")
+        return [(start, min(start + step - 1, page_count)) for start in range(1, page_count + 1, step)]
+
+    ranges = []
+    for item in text.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            start, _, end = item.partition("-")
+            split_range = (int(start), int(end or start))
+        except ValueError:
+            raise ValueError(f"Invalid split range {item}. (e.g. 1-3,5,7-9)")
+        if not 1 <= split_range[0] <= split_range[1] <= page_count:
+            raise ValueError(f"Invalid split range {item}, not valid in {page_count} Page PDF Document")
+        ranges.append(split_range)
+    return ranges
+
+
+class ObjectDeduplicator:
+    """Points every reference to a duplicated object at one copy and nulls the other copies.
+
+    Streams are compared by their dictionary and a hash of the raw, still encoded bytes,
+    fonts and similar dictionaries by their source. Rewriting references can make more
+    objects identical (two fonts sharing a font file now), so passes repeat until nothing
+    new is found. The index is kept between calls, so a growing document is only scanned
+    from first_xref on; older objects never reference newer ones.
+
+    index_existing adds objects that must stay as they are, such as those of a document
+    being edited, as the copies new ones fold into. Only their sources are read; an object
+    is checked further once a new one with the same source turns up.
+    """
+
+    DICT_TYPES = ("/Type/Font", "/Type/FontDescriptor", "/Type/ExtGState", "/Type/Encoding")
+
+    def __init__(self, passes=4):
+        self.passes = passes
+        self.index = {}
+        self.stream_hashes = {}
+        self.unhashed = {}
+        self.mapping = {}
+        self.duplicates = 0
+        self.bytes_saved = 0
+        self.seconds = 0.0
+
+    @property
+    def report(self):
+        return {"duplicates": self.duplicates, "bytes_saved": self.bytes_saved, "seconds": self.seconds}
+
+    # Key Streams by Their Dictionary and Raw Bytes, Others by Their Source, None if Never Shared
+    def _key(self, doc, xref, source):
+        if doc.xref_is_stream(xref):
+            if xref not in self.stream_hashes:
+                raw = doc.xref_stream_raw(xref) or b""
+                self.stream_hashes[xref] = (hashlib.blake2b(raw, digest_size=16).digest(), len(raw))
+            return source, self.stream_hashes[xref][0]
+        if source.startswith("<<") and any(dict_type in source for dict_type in self.DICT_TYPES):
+            return source, None
+        return None
+
+    # Make Objects first_xref to last_xref - 1 Canonical Copies Without Checking or Rewriting Them
+    def index_existing(self, doc, last_xref, first_xref=1):
+        start = time.perf_counter()
+        for xref in range(first_xref, last_xref):
+            source = doc.xref_object(xref, compressed=True)
+            if source.startswith("<<"):
+                self.unhashed.setdefault(source, []).append(xref)
+        self.seconds += time.perf_counter() - start
+
+    def deduplicate(self, doc, first_xref=1):
+        start = time.perf_counter()
+        for _ in range(self.passes):
+            found = {}
+            for xref in range(first_xref, doc.xref_length()):
+                if xref in self.mapping:
+                    continue
+                source = doc.xref_object(xref, compressed=True)
+
+                # Existing objects with the same source are keyed now, ahead of this one
+                for existing in self.unhashed.pop(source, ()):
+                    existing_key = self._key(doc, existing, source)
+                    if existing_key:
+                        self.index.setdefault(existing_key, existing)
+
+                key = self._key(doc, xref, source)
+                if not key:
+                    continue
+                size = len(source) + (self.stream_hashes[xref][1] if key[1] else 0)
+
+                canonical = self.index.setdefault(key, xref)
+                if canonical != xref:
+                    found[xref] = canonical
+                    self.bytes_saved += size
+            if not found:
+                break
+
+            self.mapping.update(found)
+            self.duplicates += len(found)
+            self._rewrite(doc, first_xref, found)
+            for xref in found:
+                doc.update_object(xref, "null")
+        self.seconds += time.perf_counter() - start
+
+    def _rewrite(self, doc, first_xref, found):
+        def replace(match):
+            xref = int(match.group(1))
+            return f"{found[xref]} 0 R" if xref in found else match.group(0)
+
+        for xref in range(first_xref, doc.xref_length()):
+            if xref in found or xref in self.mapping:
+                continue
+            source = doc.xref_object(xref, compressed=True)
+            new_source = PDF_REFERENCE.sub(replace, source)
+            if new_source == source:
+                continue
+
+            # Replacing a stream object would drop its data, so only its keys are rewritten
+            if doc.xref_is_stream(xref):
+                for key in doc.xref_get_keys(xref):
+                    value = doc.xref_get_key(xref, key)[1]
+                    new_value = PDF_REFERENCE.sub(replace, value)
+                    if new_value != value:
+                        doc.xref_set_key(xref, key, new_value)
+            else:
+                doc.update_object(xref, new_source)
+
+
+# Greedily Grow Consecutive Chunks While the Union of Their Objects Fits the Budget, Fewest Chunks for Page Order
+def plan_size_chunks(page_objects, sizes, budget, first_page=1):
+    chunks = []
+    start = 0
+    objects = set()
+    total = 0
+    for index, page in enumerate(page_objects):
+        added = sum(sizes[xref] for xref in page - objects)
+        if index > start and total + added > budget:
+            chunks.append((first_page + start, first_page + index - 1))
+            start = index
+            objects = set()
+            total = 0
+            added = sum(sizes[xref] for xref in page)
+        objects |= page
+        total += added
+    if page_objects:
+        chunks.append((first_page + start, first_page + len(page_objects) - 1))
+    return chunks
+
+
+# Budget for Re-Planning a Part That Came Out Too Large, Scaled by How Far the Estimate Was Off
+def budget_for(max_bytes, output):
+    return max_bytes * 0.95 * max_bytes / output["bytes"]
+
+
+# Objects Reachable From Each Page and the Stored Size of Every Object, Streams are not Decoded
+def page_object_sizes(doc):
+    page_xrefs = [doc.page_xref(page_number) for page_number in range(doc.page_count)]
+    other_pages = set(page_xrefs)
+    sizes = {}
+    children = {}
+
+    def visit(xref):
+        source = doc.xref_object(xref, compressed=True)
+        children[xref] = [int(ref) for ref in PDF_REFERENCE.findall(PDF_BACK_REFERENCE.sub("", source))]
+        sizes[xref] = stored_object_size(doc, xref, source)
+
+    page_objects = []
+    for page_xref in page_xrefs:
+        objects = set()
+        stack = [page_xref]
+        while stack:
+            xref = stack.pop()
+            # Links to other pages would pull in their content too
+            if xref in objects or (xref in other_pages and xref != page_xref) or not 0 < xref < doc.xref_length():
+                continue
+            objects.add(xref)
+            if xref not in sizes:
+                visit(xref)
+            stack.extend(children[xref])
+        page_objects.append(objects)
+    return page_objects, sizes
+
+
+# Collect the Content Index Data of a File Path or PDF Bytes, Runs in a Worker Process, See DocumentIndex
+def index_document(source, password=None):
+    start = time.perf_counter()
+    pdf_document = open_source(source, password)
+    page_objects, sizes = page_object_sizes(pdf_document)
+    pages = {}
+    for page, objects in zip(pdf_document, page_objects):
+        # Images listed in the resources but drawn nowhere are kept at 0 dpi
+        images = dict.fromkeys((item[0] for item in page.get_images(full=True)), 0)
+        images.update(placed_image_dpi(page))
+        fonts = tuple(sorted({item[3] for item in page.get_fonts(full=True)}))
+
+        # Without fonts there is nothing to extract, which skips scanned pages quickly
+        pages[page.xref] = {"width": page.rect.width, "height": page.rect.height, "rotation": page.rotation,
+                            "images": images, "fonts": fonts, "text": bool(fonts) and bool(page.get_text().strip()),
+                            "annotations": len(page.annot_xrefs()), "objects": objects}
+
+    encryption = pdf_document.metadata.get("encryption")
+    pdf_document.close()
+    return {"pages": pages, "sizes": sizes, "encryption": encryption, "seconds": time.perf_counter() - start}
+
+
+# Lower Case Words of a Text With Punctuation Around Them Removed
+def search_terms(text):
+    return [word for word in (SEARCH_TRIM.sub("", word) for word in text.lower().split()) if word]
+
+
+class SearchIndex:
+    """Inverted index from words to (page xref, word number), with each page's words and boxes.
+
+    Pages are added one at a time as the background indexer extracts them, and searches
+    only see the pages added so far. Every query word must match a whole word except the
+    last, which matches by prefix so results follow typing; several words match as a
+    phrase. Page xrefs stay valid for a file with the same content hash, which is what
+    the saved index is keyed by.
+    """
+
+    VERSION = 1
+
+    def __init__(self):
+        self.pages = {}
+        self.postings = {}
+        self.vocabulary = []
+        self.vocabulary_stale = False
+
+    def __contains__(self, page_xref):
+        return page_xref in self.pages
+
+    # Add a Page's Words Once, a Page Queued Again While Being Extracted Arrives Twice With the Same Words
+    def add_page(self, page_xref, words):
+        if page_xref in self.pages:
+            return
+        self.pages[page_xref] = words
+        for word_number, (word, rect) in enumerate(words):
+            self.postings.setdefault(word, []).append((page_xref, word_number))
+        self.vocabulary_stale = True
+
+    # Indexed Words Starting With prefix, From the Sorted Vocabulary
+    def complete(self, prefix):
+        if self.vocabulary_stale:
+            self.vocabulary = sorted(self.postings)
+            self.vocabulary_stale = False
+        start = bisect_left(self.vocabulary, prefix)
+        words = []
+        for word in self.vocabulary[start:]:
+            if not word.startswith(prefix):
+                break
+            words.append(word)
+        return words
+
+    # Matches in Document Order as (page number, word boxes), page_xrefs Gives the Current Page Order
+    def search(self, query, page_xrefs):
+        terms = search_terms(query)
+        if not terms:
+            return []
+        page_numbers = {xref: page_number for page_number, xref in enumerate(page_xrefs)}
+        first_words = self.complete(terms[0]) if len(terms) == 1 else [terms[0]]
+
+        matches = []
+        for word in first_words:
+            for page_xref, word_number in self.postings.get(word, ()):
+                if page_xref not in page_numbers:
+                    continue
+                words = self.pages[page_xref][word_number:word_number + len(terms)]
+                if len(words) == len(terms) and all(words[index][0] == term for index, term in enumerate(terms[1:-1], 1)) \
+                        and (len(terms) == 1 or words[-1][0].startswith(terms[-1])):
+                    matches.append((page_numbers[page_xref], word_number, [rect for _, rect in words]))
+        matches.sort(key=lambda match: match[:2])
+        return [(page_number, rects) for page_number, _, rects in matches]
+
+    def save(self, path, pages):
+        path = Path(path)
+        temp_path = path.with_name(path.name + ".tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with gzip.open(temp_path, "wt", encoding="utf-8") as file:
+                json.dump({"version": self.VERSION, "pages": pages}, file, separators=(",", ":"))
+            os.replace(temp_path, path)
+        except OSError:
+            remove_files([temp_path])
+
+    @classmethod
+    def load(cls, path):
+        index = cls()
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return index
+        if data.get("version") == cls.VERSION:
+            for page_xref, words in data["pages"].items():
+                index.add_page(int(page_xref), [(word, tuple(rect)) for word, rect in words])
+        return index
+
+
+# Start index_document in its Own Process, the Returned Future Holds the Index Data
+def submit_index(source, password=None):
+    # Forking a process that runs threads can copy a lock some thread holds, spawn starts afresh
+    pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    future = pool.submit(index_document, source, password)
+    pool.shutdown(wait=False)
+    return future
+
+
+class DocumentIndex:
+    """What each page holds, collected once per opening by index_document in a worker process.
+
+    Pages are keyed by page xref, which stays the same when other pages are deleted,
+    moved or undone, so edits never invalidate the index. Merged pages are added from
+    an index of the merged file; their object and image numbers belong to that file, so
+    the object level answers (covers_objects, image_dpi) leave such documents out.
+    """
+
+    def __init__(self, data):
+        self.pages = data["pages"]
+        self.sizes = data["sizes"]
+        self.encryption = data["encryption"]
+        self.seconds = data["seconds"]
+
+    # Pages Merged in Under Their New Xrefs, in Page Order
+    def add_pages(self, other, page_xrefs):
+        for xref, page in zip(page_xrefs, other.pages.values()):
+            self.pages[xref] = dict(page, objects=None)
+
+    def covers(self, page_xrefs):
+        return all(xref in self.pages for xref in page_xrefs)
+
+    def covers_objects(self, page_xrefs):
+        return all(self.pages.get(xref, {}).get("objects") is not None for xref in page_xrefs)
+
+    # True or False, None While Some Page is Not Indexed Yet
+    def has_images(self, page_xrefs):
+        if not self.covers(page_xrefs):
+            return None
+        return any(self.pages[xref]["images"] for xref in page_xrefs)
+
+    # Highest Placed Resolution of Each Image on the Given Pages, as collect_image_jobs Takes it
+    def image_dpi(self, page_xrefs):
+        if not self.covers_objects(page_xrefs):
+            return None
+        image_dpi = {}
+        for xref in page_xrefs:
+            for image_xref, placed_dpi in self.pages[xref]["images"].items():
+                image_dpi[image_xref] = max(image_dpi.get(image_xref, 0), placed_dpi)
+        return {xref: placed_dpi for xref, placed_dpi in image_dpi.items() if placed_dpi}
+
+    # Page, Image, Font, Text and Annotation Counts of the Given Pages
+    def summary(self, page_xrefs):
+        pages = [self.pages[xref] for xref in page_xrefs if xref in self.pages]
+
+        # Images of merged pages are numbered in their own file, they are counted per page and not sized
+        images = {image_xref for page in pages if page["objects"] is not None for image_xref in page["images"]}
+        merged_images = sum(len(page["images"]) for page in pages if page["objects"] is None)
+        return {"pages": len(pages), "text_pages": sum(page["text"] for page in pages),
+                "images": len(images) + merged_images, "image_bytes": sum(self.sizes.get(xref, 0) for xref in images),
+                "fonts": len({font for page in pages for font in page["fonts"]}),
+                "annotations": sum(page["annotations"] for page in pages), "encryption": self.encryption}
+
+
+# Size an Object Takes in the File, From its Source and Stream Length, Streams are not Decoded
+def stored_object_size(doc, xref, source=None):
+    if source is None:
+        source = doc.xref_object(xref, compressed=True)
+    size = len(source) + 20  # "N 0 obj" framing and xref table entry
+    if doc.xref_is_stream(xref):
+        kind, value = doc.xref_get_key(xref, "Length")
+        if kind == "int":
+            size += int(value)
+        else:
+            size += len(doc.xref_stream_raw(xref) or b"")
+    return size
+
+
+# Open a File Path or PDF Bytes, Authenticating With the Password if the File Needs One
+def open_source(source, password=None):
+    if isinstance(source, bytes):
+        pdf_document = fitz.open(stream=source, filetype="pdf")
+    else:
+        pdf_document = fitz.open(source)
+    if pdf_document.needs_pass and not pdf_document.authenticate(password or ""):
+        raise ValueError("Password is required to open the PDF file.")
+    return pdf_document
+
+
+class OperationCancelled(Exception):
+    """Raised by a save, split or compress stopped through its cancel event, after its output was removed."""
+
+
+# Raise OperationCancelled Once the Cancel Event of a Background Operation is Set
+def check_cancelled(cancel):
+    if cancel is not None and cancel.is_set():
+        raise OperationCancelled()
+
+
+# Remove Files Left by a Failed or Cancelled Write, Ignoring Those Never Created
+def remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# Runs in the Process Started by run_isolated, Progress, the Result or the Error go Back Through connection
+def _isolated_worker(function, args, kwargs, cancel, connection):
+    def progress(fraction, text):
+        connection.send(("progress", fraction, text))
+
+    try:
+        connection.send(("result", function(*args, cancel=cancel, progress=progress, **kwargs)))
+    except BaseException as e:
+        try:
+            pickle.dumps(e)
+        except Exception:
+            e = RuntimeError(str(e) or type(e).__name__)
+        connection.send(("error", e))
+    finally:
+        connection.close()
+
+
+# Call function(*args, cancel=, progress=, **kwargs) in its Own Process Unless This is the Main Thread
+def run_isolated(function, *args, cancel=None, progress=None, poll_seconds=0.1, **kwargs):
+    """PyMuPDF shares one MuPDF context and global settings such as the anti-aliasing level
+    between all threads, so MuPDF work on a background thread of the viewer would race its
+    renders even on a separate document. Such work runs in a spawned process instead; a
+    cancel is handed on to it so it still cleans up its own files. The command line calls
+    from the main thread and runs function directly."""
+    if threading.current_thread() is threading.main_thread():
+        return function(*args, cancel=cancel, progress=progress, **kwargs)
+
+    context = multiprocessing.get_context("spawn")
+    process_cancel = context.Event()
+    reader, writer = context.Pipe(duplex=False)
+    process = context.Process(target=_isolated_worker, args=(function, args, kwargs, process_cancel, writer), daemon=False)
+    process.start()
+    writer.close()
+    try:
+        while True:
+            if cancel is not None and cancel.is_set():
+                process_cancel.set()
+            if not reader.poll(poll_seconds):
+                if not process.is_alive() and not reader.poll():
+                    raise OSError(f"worker process exited with code {process.exitcode}")
+                continue
+            try:
+                message = reader.recv()
+            except EOFError:
+                raise OSError(f"worker process exited with code {process.exitcode}") from None
+            if message[0] == "progress":
+                if progress:
+                    progress(*message[1:])
+            elif message[0] == "result":
+                return message[1]
+            else:
+                raise message[1]
+    finally:
+        # The process removes its own files once it sees the cancel, a stuck one is stopped
+        process_cancel.set()
+        process.join(30)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+        reader.close()
+
+
+# Run function Over Argument Groups in up to workers Processes, Results in Group Order
+def run_groups(function, groups, workers, cancel=None, on_group=None, poll_seconds=0.1):
+    """on_group is called with each group's result as it finishes. A cancel stops queued
+    groups and waits for the running ones, so nothing is still writing when it returns."""
+    results = [None] * len(groups)
+    if workers == 1:
+        for index, args in enumerate(groups):
+            check_cancelled(cancel)
+            results[index] = function(*args)
+            if on_group:
+                on_group(results[index])
+        return results
+
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = {pool.submit(function, *args): index for index, args in enumerate(groups)}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=poll_seconds)
+            for future in done:
+                results[futures[future]] = future.result()
+                if on_group:
+                    on_group(results[futures[future]])
+            check_cancelled(cancel)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+    return results
+
+
+# True When the Colour Channels Differ by no More Than tolerance Anywhere
+def is_effectively_gray(img, tolerance=8):
+    red, green, blue = img.split()
+    return (ImageChops.difference(red, green).getextrema()[1] <= tolerance
+            and ImageChops.difference(green, blue).getextrema()[1] <= tolerance)
+
+
+# True When Almost all Pixels of a Gray Image are Near Black or White
+def is_effectively_bilevel(img, margin=48, tolerance=0.005):
+    histogram = img.histogram()
+    middle = sum(histogram[margin:256 - margin])
+    return middle <= tolerance * img.width * img.height
+
+
+# Decode an Image XObject to an L or RGB PIL Image, Dropping Alpha and Converting CMYK
+def decode_image(pdf_document, xref):
+    pix = fitz.Pixmap(pdf_document, xref)
+    if pix.alpha:
+        pix = fitz.Pixmap(pix, 0)
+    if pix.n not in (1, 3):
+        pix = fitz.Pixmap(fitz.csRGB, pix)
+    mode = "L" if pix.n == 1 else "RGB"
+    return Image.frombuffer(mode, (pix.width, pix.height), pix.samples_mv, "raw", mode, 0, 1)
+
+
+# Downsample, Classify and Re-Encode One Image, Returns the Action, Stream Data, Dictionary Keys and Size
+def encode_image(img, dpi, settings):
+    if img.mode == "RGB" and settings["gray"] and is_effectively_gray(img):
+        img = img.convert("L")
+    bilevel = img.mode == "L" and settings["bilevel"] and is_effectively_bilevel(img)
+
+    # Bilevel scans keep more resolution, their edges are all they have
+    ceiling = settings["bilevel_dpi"] if bilevel else settings["dpi"]
+    if ceiling and dpi > ceiling:
+        factor = ceiling / dpi
+        img = img.resize((max(round(img.width * factor), 1), max(round(img.height * factor), 1)), Image.LANCZOS)
+
+    if bilevel:
+        img = img.point(lambda value: 255 if value >= 128 else 0).convert("1")
+        data = zlib.compress(img.tobytes(), 9)
+        keys = {"Filter": "/FlateDecode", "ColorSpace": "/DeviceGray", "BitsPerComponent": "1"}
+        action = "bilevel"
+    else:
+        buffer = BytesIO()
+        img.save(buffer, "JPEG", quality=settings["quality"], optimize=True)
+        data = buffer.getvalue()
+        keys = {"Filter": "/DCTDecode", "ColorSpace": "/DeviceGray" if img.mode == "L" else "/DeviceRGB", "BitsPerComponent": "8"}
+        action = "gray jpeg" if img.mode == "L" else "jpeg"
+    keys.update(Width=str(img.width), Height=str(img.height))
+    return action, data, keys, img.size
+
+
+# Decode, Downsample, Classify and Re-Encode a Group of Images, Runs in a Worker Process
+def _compress_images_worker(source, password, jobs, settings):
+    pdf_document = open_source(source, password)
+    results = []
+    for xref, dpi in jobs:
+        before = len(pdf_document.xref_stream_raw(xref) or b"")
+        result = {"xref": xref, "dpi": round(dpi), "before": before, "after": before, "action": "kept"}
+        results.append(result)
+        try:
+            img = decode_image(pdf_document, xref)
+        except Exception as e:
+            result["action"] = f"kept ({e})"
+            continue
+
+        action, data, keys, (width, height) = encode_image(img, dpi, settings)
+        if len(data) < before:
+            result.update(after=len(data), action=action, width=width, height=height, data=data, keys=keys)
+    return results
+
+
+# Highest Resolution Each Image of a Page is Placed at, Images Drawn Nowhere are Left out
+def placed_image_dpi(page):
+    image_dpi = {}
+    # get_image_info(xrefs=True) would decode and hash every image to match xrefs
+    for item in page.get_images(full=True):
+        xref = item[0]
+        try:
+            bbox = page.get_image_bbox(item)
+        except ValueError:
+            continue
+        if bbox.is_empty or bbox.is_infinite:
+            continue
+        placed_dpi = max(item[2] * 72 / bbox.width, item[3] * 72 / bbox.height)
+        image_dpi[xref] = max(image_dpi.get(xref, 0), placed_dpi)
+    return image_dpi
+
+
+# Images Worth Recompressing With the Highest Resolution Each is Placed at on any Page
+def collect_image_jobs(pdf_document, min_bytes=4096, image_dpi=None):
+    # image_dpi from the content index saves scanning the pages again
+    if image_dpi is None:
+        image_dpi = {}
+        for page in pdf_document:
+            for xref, placed_dpi in placed_image_dpi(page).items():
+                image_dpi[xref] = max(image_dpi.get(xref, 0), placed_dpi)
+
+    jobs = []
+    for xref, placed_dpi in image_dpi.items():
+        if any(pdf_document.xref_get_key(xref, key)[0] != "null" for key in ("SMask", "Mask", "ImageMask")):
+            continue
+        kind, length = pdf_document.xref_get_key(xref, "Length")
+        if kind == "int" and int(length) < min_bytes:
+            continue
+        jobs.append((xref, placed_dpi))
+    return jobs
+
+
+# Pick One Item From Each of up to count Equal Slices of items Sorted by Size
+def stratified_sample(items, size_of, count):
+    """Returns (item, slice_bytes) pairs so each sampled item stands for the bytes of its
+    slice, which keeps a few huge images from being either missed or over counted."""
+    items = sorted(items, key=size_of)
+    count = min(count, len(items))
+    sample = []
+    for index in range(count):
+        group = items[len(items) * index // count:len(items) * (index + 1) // count]
+        sample.append((group[len(group) // 2], sum(size_of(item) for item in group)))
+    return sample
+
+
+# Project the Output Size and Time of Each Preset From a Sample of Images and Streams
+def estimate_compression(source, password=None, presets=None, sample_images=8, sample_streams=16, workers=None,
+                         min_bytes=4096, image_dpi=None, cancel=None, progress=None):
+    """Only the sampled images are decoded, once each, and re-encoded for every preset; the
+    sampled uncompressed streams are deflated once since that part is the same for all
+    presets. Everything else in the file is assumed to stay the same size, so savings from
+    deduplication are not included and the projection errs on the large side. The time
+    covers scanning the file and the image work spread over the workers, not saving."""
+    start = time.perf_counter()
+    presets = presets or COMPRESS_PRESETS
+    pdf_document = open_source(source, password)
+    bytes_before = len(source) if isinstance(source, bytes) else os.path.getsize(source)
+
+    jobs = collect_image_jobs(pdf_document, min_bytes, image_dpi)
+    scan_seconds = time.perf_counter() - start
+    image_xrefs = {xref for xref, _ in jobs}
+    image_sizes = {xref: len(pdf_document.xref_stream_raw(xref) or b"") for xref, _ in jobs}
+    image_bytes = sum(image_sizes.values())
+
+    # Streams without a filter are the ones deflate=True will still shrink
+    plain_streams = {}
+    for xref in range(1, pdf_document.xref_length()):
+        if xref not in image_xrefs and pdf_document.xref_is_stream(xref) and pdf_document.xref_get_key(xref, "Filter")[0] == "null":
+            kind, length = pdf_document.xref_get_key(xref, "Length")
+            plain_streams[xref] = int(length) if kind == "int" else 0
+    stream_bytes = sum(plain_streams.values())
+
+    streams_after = stream_seconds = 0
+    for xref, slice_bytes in stratified_sample(plain_streams, plain_streams.get, sample_streams):
+        raw = pdf_document.xref_stream_raw(xref) or b""
+        if not raw:
+            continue
+        timer = time.perf_counter()
+        ratio = len(zlib.compress(raw)) / len(raw)
+        stream_seconds += (time.perf_counter() - timer) * slice_bytes / len(raw)
+        streams_after += ratio * slice_bytes
+
+    projected = {name: {"image_bytes": 0, "image_seconds": 0} for name in presets}
+    sample = stratified_sample(jobs, lambda job: image_sizes[job[0]], sample_images)
+    for number, ((xref, dpi), slice_bytes) in enumerate(sample, 1):
+        check_cancelled(cancel)
+        before = image_sizes[xref]
+        timer = time.perf_counter()
+        try:
+            img = decode_image(pdf_document, xref)
+        except Exception:
+            for name in presets:
+                projected[name]["image_bytes"] += slice_bytes
+            continue
+        decode_seconds = time.perf_counter() - timer
+
+        for name, preset in presets.items():
+            settings = dict(dict(gray=True, bilevel=True, bilevel_dpi=300), **preset)
+            timer = time.perf_counter()
+            after = min(len(encode_image(img, dpi, settings)[1]), before)
+            seconds = decode_seconds + time.perf_counter() - timer
+            projected[name]["image_bytes"] += slice_bytes * after / max(before, 1)
+            projected[name]["image_seconds"] += seconds * slice_bytes / max(before, 1)
+        if progress:
+            progress(number, len(sample))
+    pdf_document.close()
+
+    workers = max(min(workers or os.cpu_count() or 1, len(jobs)), 1)
+    unchanged = bytes_before - image_bytes - stream_bytes
+    results = {}
+    for name, estimate in projected.items():
+        results[name] = {"bytes": round(unchanged + estimate["image_bytes"] + streams_after),
+                         "seconds": scan_seconds + estimate["image_seconds"] / workers + stream_seconds}
+    return {"bytes_before": bytes_before, "images": len(jobs), "sampled_images": len(sample), "presets": results,
+            "seconds": time.perf_counter() - start}
+
+
+# Save a File Path or PDF Bytes to output_file, Runs in its Own Process so a Cancel Can Stop MuPDF Midway
+def _save_worker(source, password, output_file, options, connection):
+    try:
+        pdf_document = open_source(source, password)
+        pdf_document.save(output_file, **options)
+        pdf_document.close()
+        connection.send("")
+    except Exception as e:
+        connection.send(str(e) or type(e).__name__)
+    finally:
+        connection.close()
+
+
+# Save a File Path or PDF Bytes With MuPDF save() Options to a Temp File That Replaces output_file Once Complete
+def save_file_atomic(source, output_file, password=None, cancel=None, progress=None, poll_seconds=0.1, **options):
+    """The garbage collect and deflate pass cannot be interrupted inside MuPDF, so it runs in
+    a worker process that a cancel terminates. Progress is the size of the temp file against
+    the source size, which is only a guide since the output may come out smaller or larger."""
+    start = time.perf_counter()
+    temp_file = f"{output_file}.part"
+    bytes_before = len(source) if isinstance(source, bytes) else os.path.getsize(source)
+    context = multiprocessing.get_context("spawn")
+    reader, writer = context.Pipe(duplex=False)
+    process = context.Process(target=_save_worker, args=(source, password, temp_file, options, writer), daemon=True)
+    process.start()
+    writer.close()
+    try:
+        while process.is_alive():
+            process.join(poll_seconds)
+            check_cancelled(cancel)
+            if progress:
+                written = os.path.getsize(temp_file) if os.path.exists(temp_file) else 0
+                progress(min(written / max(bytes_before, 1), 0.99), f"{written / 1024 / 1024:.1f} MB written")
+
+        error = reader.recv() if reader.poll() else f"save process exited with code {process.exitcode}"
+        if error:
+            raise OSError(error)
+        os.replace(temp_file, output_file)
+    except BaseException:
+        if process.is_alive():
+            process.terminate()
+            process.join()
+        remove_files([temp_file])
+        raise
+    finally:
+        reader.close()
+    return {"output": output_file, "bytes_before": bytes_before, "bytes_after": os.path.getsize(output_file),
+            "seconds": time.perf_counter() - start}
+
+
+# Recompress and Downsample the Embedded Images of a File Path or PDF Bytes into output_file
+def compress_file(source, output_file, workers=None, password=None, dpi=150, quality=75, gray=True, bilevel=True,
+                  bilevel_dpi=300, min_bytes=4096, cancel=None, progress=None, image_dpi=None):
+    """Images placed above dpi, unless it is None, are downsampled to it, then re-encoded as JPEG at quality, as
+    gray JPEG when their colours are all gray, or as 1 bit Flate when they are black and white.
+    Images with soft masks or stencil masks are left alone, and so is any image whose new
+    encoding is not smaller. Decoding and encoding run in worker processes that each open the
+    source once; the main process only swaps the streams, deduplicates and saves to a temp
+    file that replaces output_file when complete, so a cancel or error leaves nothing behind."""
+    start = time.perf_counter()
+    settings = {"dpi": dpi, "quality": quality, "gray": gray, "bilevel": bilevel, "bilevel_dpi": bilevel_dpi}
+    pdf_document = open_source(source, password)
+    bytes_before = len(source) if isinstance(source, bytes) else os.path.getsize(source)
+    jobs = collect_image_jobs(pdf_document, min_bytes, image_dpi)
+
+    workers = max(min(workers or os.cpu_count() or 1, len(jobs)), 1)
+    groups = [(source, password, jobs[index::workers], settings) for index in range(workers)]
+    done = []
+
+    # Images are most of the work, the save is counted as the last tenth
+    def on_group(group):
+        done.extend(group)
+        if progress:
+            progress(0.9 * len(done) / max(len(jobs), 1), f"{len(done)} of {len(jobs)} images")
+
+    temp_file = f"{output_file}.part"
+    try:
+        results = [result for group in run_groups(_compress_images_worker, groups, workers, cancel, on_group) for result in group]
+        for result in results:
+            if "data" in result:
+                pdf_document.update_stream(result["xref"], result.pop("data"), compress=False)
+                for key, value in result.pop("keys").items():
+                    pdf_document.xref_set_key(result["xref"], key, value)
+                pdf_document.xref_set_key(result["xref"], "Decode", "null")
+
+        deduplicator = ObjectDeduplicator()
+        deduplicator.deduplicate(pdf_document)
+        check_cancelled(cancel)
+        if progress:
+            progress(0.9, "saving")
+        pdf_document.save(temp_file, **COMPRESS_OPTIONS)
+        check_cancelled(cancel)
+        os.replace(temp_file, output_file)
+    except BaseException:
+        remove_files([temp_file])
+        raise
+    finally:
+        pdf_document.close()
+
+    results.sort(key=lambda result: result["xref"])
+    return {"output": output_file, "images": results,
+            "image_bytes_before": sum(result["before"] for result in results),
+            "image_bytes_after": sum(result["after"] for result in results),
+            "bytes_before": bytes_before, "bytes_after": os.path.getsize(output_file),
+            "dedup": deduplicator.report, "seconds": time.perf_counter() - start}
+
+
+# Write a Group of Ranges From One Opening of the Source, Runs in a Worker Process
+def _split_worker(source, password, jobs):
+    pdf_document = open_source(source, password)
+
+    results = []
+    for split_range, output_file in jobs:
+        start = time.perf_counter()
+        part = fitz.open()
+        part.insert_pdf(pdf_document, from_page=split_range[0] - 1, to_page=split_range[1] - 1)
+        part.save(f"{output_file}.part", garbage=1)
+        part.close()
+
+        # The caller moves the parts into place once every range is done, so it knows every file it wrote
+        results.append({"range": split_range, "output": output_file, "pages": split_range[1] - split_range[0] + 1,
+                        "bytes": os.path.getsize(f"{output_file}.part"), "seconds": time.perf_counter() - start})
+    return results
+
+
+# Path of the Part Holding a 1 Based Range, stem_first_last.pdf in output_dir
+def split_output_path(output_dir, stem, split_range):
+    return str(Path(output_dir) / f"{stem}_{split_range[0]}_{split_range[1]}.pdf")
+
+
+# Split a File Path or PDF Bytes into stem_first_last.pdf Files, One Source Opening per Worker
+def split_file(source, split_ranges, output_dir, stem, workers=None, password=None, cancel=None, progress=None):
+    start = time.perf_counter()
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    # A range given twice would be the same file written by two workers at once, it is written once
+    split_ranges = list(dict.fromkeys(tuple(split_range) for split_range in split_ranges))
+    jobs = [(split_range, split_output_path(output_dir, stem, split_range)) for split_range in split_ranges]
+    workers = max(min(workers or os.cpu_count() or 1, len(jobs)), 1)
+
+    # Hand each range to the worker with the fewest pages so far
+    groups = [[] for _ in range(workers)]
+    pages = [0] * workers
+    for job in sorted(jobs, key=lambda job: job[0][0] - job[0][1]):
+        index = pages.index(min(pages))
+        groups[index].append(job)
+        pages[index] += job[0][1] - job[0][0] + 1
+
+    done = []
+
+    def on_group(group):
+        done.extend(group)
+        if progress:
+            progress(len(done) / len(jobs), f"{len(done)} of {len(jobs)} files")
+
+    # Parts replace their outputs only once all are written, so a cancel or failure leaves existing files alone
+    # and removes nothing but this run's temp files and the outputs it already moved into place
+    written = []
+    try:
+        results = [result for group in run_groups(_split_worker, [(source, password, group) for group in groups], workers,
+                                                  cancel, on_group) for result in group]
+        for result in results:
+            os.replace(f"{result['output']}.part", result["output"])
+            written.append(result["output"])
+    except BaseException:
+        remove_files(written + [f"{output_file}.part" for _, output_file in jobs])
+        raise
+
+    # Report in the order the ranges were given
+    order = {job[1]: index for index, job in enumerate(jobs)}
+    results.sort(key=lambda result: order[result["output"]])
+    return {"outputs": results, "seconds": time.perf_counter() - start}
+
+
+# Split a File Path or PDF Bytes into the Fewest Consecutive Parts That Stay Under max_bytes, Planned From Size Estimates
+def split_file_by_size(source, max_bytes, output_dir, stem, workers=None, password=None, passes=3, page_objects=None,
+                       cancel=None, progress=None):
+    start = time.perf_counter()
+
+    # The content index walked the same objects in the background, without it they are walked here
+    if page_objects is None:
+        pdf_document = open_source(source, password)
+        page_objects = page_object_sizes(pdf_document)
+        pdf_document.close()
+    page_objects, sizes = page_objects
+
+    # Estimates miss compression and trailer changes, plan a little under the limit
+    pending = [((1, len(page_objects)), max_bytes * 0.95)]
+    outputs = []
+    oversized = []
+    plan_seconds = 0.0
+    current_pass = 0
+    try:
+        while pending:
+            plan_start = time.perf_counter()
+            split_ranges = []
+            for (first, last), budget in pending:
+                if budget is None:
+                    split_ranges.extend([(first, (first + last) // 2), ((first + last) // 2 + 1, last)])
+                else:
+                    split_ranges.extend(plan_size_chunks(page_objects[first - 1:last], sizes, budget, first))
+            plan_seconds += time.perf_counter() - plan_start
+            report = split_file(source, split_ranges, output_dir, stem, workers, password, cancel, progress)
+            current_pass += 1
+
+            # Parts that came out too large are planned again with a tighter budget, and once the passes
+            # are used up halved, since what each file adds besides its pages can outweigh any budget
+            pending = []
+            for output in report["outputs"]:
+                too_large = output["bytes"] > max_bytes
+                if too_large and output["pages"] > 1:
+                    os.remove(output["output"])
+                    pending.append((output["range"], budget_for(max_bytes, output) if current_pass < passes else None))
+                    continue
+                if too_large:
+                    oversized.append(output)
+                outputs.append(output)
+    except BaseException:
+        # Parts kept by earlier passes go too
+        remove_files(output["output"] for output in outputs)
+        raise
+
+    outputs.sort(key=lambda output: output["range"])
+    return {"outputs": outputs, "oversized": oversized, "plan_seconds": plan_seconds, "seconds": time.perf_counter() - start}
+
+
+# Document a Pool Worker Opened Once for All its Jobs, Set by _open_worker_source
+_worker_document = None
+
+
+# Pool Initializer, Opens the Source Once per Worker Process Instead of Once per Job
+def _open_worker_source(source, password):
+    global _worker_document
+    _worker_document = open_source(source, password)
+
+
+# Text Blocks of a Page in Reading Order With Their Boxes, Lines End in a Newline
+def text_blocks(page):
+    # Built from the dict output, get_text("blocks") leaks a few Python objects per page in PyMuPDF
+    # and get_text("text", sort=True) is several times slower than sorting the blocks here
+    blocks = []
+    for block in page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT, sort=True)["blocks"]:
+        text = "".join("".join(span["text"] for span in line["spans"]) + "\n" for line in block["lines"])
+        blocks.append([round(value, 1) for value in block["bbox"]] + [text])
+    return blocks
+
+
+# Text of One Page as Plain Text, Text Blocks or Words, Boxes Rounded to 0.1 pt
+def page_content(page, mode):
+    if mode == "text":
+        return "".join(block[4] for block in text_blocks(page))
+    if mode == "blocks":
+        return text_blocks(page)
+    if mode == "words":
+        return [[round(x0, 1), round(y0, 1), round(x1, 1), round(y1, 1), word, block_number, line_number]
+                for x0, y0, x1, y1, word, block_number, line_number, word_number in page.get_text("words", sort=True)]
+    raise ValueError(f"Unknown text mode {mode}")
+
+
+# Run a Chunk on the Worker's Own Document, function Takes the Document, the Chunk and args
+def _run_worker_chunk(function, chunk, args):
+    return function(_worker_document, chunk, *args)
+
+
+# Yield (chunk, function result) in Chunk Order, Chunks Fanned out Across Workers That Open the Source Once
+def iter_worker_chunks(function, chunks, source, password=None, workers=None, cancel=None, args=()):
+    """At most two chunks per worker are queued or held at a time, so memory stays flat
+    however many chunks there are. Closing the generator early, a cancel or an error
+    shuts the pool down with it. With one worker the chunks run in this process."""
+    workers = max(min(workers or os.cpu_count() or 1, len(chunks)), 1)
+    if workers == 1:
+        pdf_document = open_source(source, password)
+        try:
+            for chunk in chunks:
+                check_cancelled(cancel)
+                yield chunk, function(pdf_document, chunk, *args)
+        finally:
+            pdf_document.close()
+        return
+
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_open_worker_source, initargs=(source, password))
+    try:
+        pending = deque()
+        for chunk in chunks:
+            if len(pending) == 2 * workers:
+                done_chunk, future = pending.popleft()
+                yield done_chunk, future.result()
+                check_cancelled(cancel)
+            pending.append((chunk, pool.submit(_run_worker_chunk, function, chunk, args)))
+        while pending:
+            done_chunk, future = pending.popleft()
+            yield done_chunk, future.result()
+            check_cancelled(cancel)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+# Split Page Numbers into Chunks, None Means Every Page of the Source
+def page_chunks(source, password, page_numbers, chunk_pages):
+    if page_numbers is None:
+        pdf_document = open_source(source, password)
+        page_numbers = range(pdf_document.page_count)
+        pdf_document.close()
+    return [page_numbers[start:start + chunk_pages] for start in range(0, len(page_numbers), chunk_pages)]
+
+
+def _extract_text_worker(pdf_document, page_numbers, mode):
+    return [page_content(pdf_document[page_number], mode) for page_number in page_numbers]
+
+
+# Yield {"page": number, mode: content} per Page in Page Order, Pages Fanned out in Chunks Across Workers
+def iter_page_content(source, mode="text", password=None, page_numbers=None, workers=None, chunk_pages=32, cancel=None):
+    """Page numbers are 0 based, the yielded ones 1 based. See iter_worker_chunks for how
+    the pages are spread and why memory stays flat."""
+    chunks = page_chunks(source, password, page_numbers, chunk_pages)
+    for chunk, contents in iter_worker_chunks(_extract_text_worker, chunks, source, password, workers, cancel, (mode,)):
+        for page_number, content in zip(chunk, contents):
+            yield {"page": page_number + 1, mode: content}
+
+
+# One Page of iter_page_content as Output Text, a JSON Line, or Plain Text Ending in a Form Feed Like pdftotext
+def format_page_content(page, mode, output_format):
+    if output_format == "jsonl":
+        return json.dumps(page, ensure_ascii=False) + "\n"
+    content = page[mode]
+    if mode == "blocks":
+        content = "\n\n".join(block[4].rstrip("\n") for block in content) + "\n"
+    elif mode == "words":
+        lines = {}
+        for word in content:
+            lines.setdefault((word[5], word[6]), []).append(word[4])
+        content = "".join(" ".join(words) + "\n" for words in lines.values())
+    return content + "\f"
+
+
+# Stream the Text of a File Path or PDF Bytes to a TXT or JSONL File, Written to a Temp File First
+def export_text(source, output_file, mode="text", output_format=None, password=None, page_numbers=None, workers=None,
+                chunk_pages=32, cancel=None, progress=None):
+    start = time.perf_counter()
+    output_format = output_format or ("jsonl" if str(output_file).endswith(".jsonl") else "txt")
+    if page_numbers is None:
+        pdf_document = open_source(source, password)
+        page_numbers = range(pdf_document.page_count)
+        pdf_document.close()
+
+    pages = 0
+    temp_file = f"{output_file}.part"
+    try:
+        with open(temp_file, "w", encoding="utf-8", newline="\n") as file:
+            for page in iter_page_content(source, mode, password, page_numbers, workers, chunk_pages, cancel):
+                file.write(format_page_content(page, mode, output_format))
+                pages += 1
+                if progress and pages % chunk_pages == 0:
+                    progress(pages / len(page_numbers), f"{pages} of {len(page_numbers)} pages")
+        os.replace(temp_file, output_file)
+    except BaseException:
+        remove_files([temp_file])
+        raise
+
+    seconds = time.perf_counter() - start
+    return {"output": str(output_file), "pages": pages, "bytes": os.path.getsize(output_file), "seconds": seconds,
+            "pages_per_second": pages / max(seconds, 1e-9)}
+
+
+# Render a Page Like show_page Does, in RGB, Gray, or Gray Thresholded to Black and White
+def page_pixmap(page, scale, colorspace="rgb"):
+    pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False,
+                          colorspace=fitz.csRGB if colorspace == "rgb" else fitz.csGRAY)
+    if colorspace != "bilevel":
+        return pix
+    # The view of the samples has to go before the pixmap does
+    img = Image.frombuffer("L", (pix.width, pix.height), pix.samples_mv, "raw", "L", 0, 1)
+    bilevel = img.point(lambda value: 255 if value >= 128 else 0, "1")
+    del img
+    return bilevel
+
+
+# Write One Page as an Image File, MuPDF Encodes PNG and JPEG, PIL TIFF and Bilevel
+def write_page_image(page, output_file, dpi, colorspace, image_format, quality):
+    pix = page_pixmap(page, dpi / 72, colorspace)
+    if isinstance(pix, Image.Image):
+        compression = "group4" if image_format == "tiff" else None
+        pix.save(output_file, RASTER_FORMATS[image_format][0], dpi=(dpi, dpi), **({"compression": compression} if compression else {}))
+    elif image_format == "tiff":
+        mode = "RGB" if colorspace == "rgb" else "L"
+        img = Image.frombuffer(mode, (pix.width, pix.height), pix.samples_mv, "raw", mode, 0, 1)
+        img.save(output_file, "TIFF", dpi=(dpi, dpi), compression="tiff_lzw")
+        del img
+    else:
+        pix.set_dpi(dpi, dpi)
+        pix.save(output_file, RASTER_FORMATS[image_format][0].lower(), jpg_quality=quality)
+    return os.path.getsize(output_file)
+
+
+def _rasterize_worker(pdf_document, jobs, dpi, colorspace, image_format, quality):
+    results = []
+    for page_number, output_file in jobs:
+        start = time.perf_counter()
+        # The caller moves the parts into place once every page is done, so it knows every file it wrote
+        size = write_page_image(pdf_document[page_number], f"{output_file}.part", dpi, colorspace, image_format, quality)
+        results.append({"page": page_number + 1, "output": output_file, "bytes": size, "seconds": time.perf_counter() - start})
+    return results
+
+
+# Render Pages of a File Path or PDF Bytes to stem_0001.png Like Files, Spread Across Worker Processes
+def rasterize_file(source, output_dir, stem, page_numbers=None, dpi=150, colorspace="rgb", image_format="png", quality=90,
+                   password=None, workers=None, chunk_pages=4, cancel=None, progress=None):
+    """Every worker opens the source once and writes its pages straight to disk, only the
+    small per page reports come back. The images replace existing files of the same name
+    only once every page is done, so a cancelled or failed export removes its own temp files
+    and leaves the folder as it was. Page numbers are 0 based."""
+    if colorspace not in ("rgb", "gray", "bilevel"):
+        raise ValueError(f"Unknown colour space {colorspace}")
+    if image_format == "jpeg" and colorspace == "bilevel":
+        raise ValueError("JPEG cannot store black and white images, use PNG or TIFF.")
+
+    start = time.perf_counter()
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    chunks = page_chunks(source, password, page_numbers, chunk_pages)
+    pages = sum(len(chunk) for chunk in chunks)
+    digits = len(str(max((page_number + 1 for chunk in chunks for page_number in chunk), default=1)))
+    extension = RASTER_FORMATS[image_format][1]
+    jobs = [[(page_number, str(Path(output_dir) / f"{stem}_{page_number + 1:0{digits}d}{extension}")) for page_number in chunk]
+            for chunk in chunks]
+
+    results = []
+    written = []
+    try:
+        for chunk, chunk_results in iter_worker_chunks(_rasterize_worker, jobs, source, password, workers, cancel,
+                                                       (dpi, colorspace, image_format, quality)):
+            results.extend(chunk_results)
+            if progress:
+                progress(len(results) / pages, f"{len(results)} of {pages} pages")
+        for result in results:
+            os.replace(f"{result['output']}.part", result["output"])
+            written.append(result["output"])
+    except BaseException:
+        remove_files(written + [f"{output_file}.part" for chunk in jobs for _, output_file in chunk])
+        raise
+
+    seconds = time.perf_counter() - start
+    return {"outputs": results, "pages": len(results), "bytes": sum(result["bytes"] for result in results),
+            "seconds": seconds, "pages_per_second": len(results) / max(seconds, 1e-9)}
+
+
+# Pages Each Image Appears on in pages first..last-1 of One Source, With its Size and a Hash of its Stored Stream
+def _scan_images_worker(source, password, first, last):
+    try:
+        pdf_document = open_source(source, password)
+    except Exception as e:
+        return {"error": str(e)}
+
+    images = {}
+    unreadable = set()
+    for page_number in range(first, min(last, pdf_document.page_count)):
+        for xref, smask, width, height, bits, colorspace, alt_colorspace, name, image_filter, *_ in \
+                pdf_document.get_page_images(page_number, full=True):
+            if xref in unreadable:
+                continue
+            if xref not in images:
+                # A damaged or missing stream is skipped and counted, the other images are still extracted
+                raw = pdf_document.xref_stream_raw(xref)
+                if raw is None:
+                    unreadable.add(xref)
+                    continue
+                digest = hashlib.blake2b(raw, digest_size=16).hexdigest()
+                images[xref] = {"digest": digest, "width": width, "height": height, "colorspace": colorspace,
+                                "filter": image_filter, "smask": smask, "pages": []}
+            if not images[xref]["pages"] or images[xref]["pages"][-1] != page_number + 1:
+                images[xref]["pages"].append(page_number + 1)
+    pdf_document.close()
+    return {"images": images, "unreadable": sorted(unreadable)}
+
+
+# Write Images of One Source as digest.ext in Their Stored Encoding Where a File Format Holds it
+def _write_images_worker(source, password, jobs, output_dir):
+    pdf_document = open_source(source, password)
+    results = []
+    for xref, digest in jobs:
+        # JPEG, JPEG 2000 and the like come out as stored, other encodings are written losslessly as PNG
+        image = pdf_document.extract_image(xref)
+        output_file = Path(output_dir) / f"{digest}.{image['ext']}"
+        temp_file = f"{output_file}.part"
+        with open(temp_file, "wb") as file:
+            file.write(image["image"])
+        os.replace(temp_file, output_file)
+        results.append({"digest": digest, "file": output_file.name, "bytes": len(image["image"])})
+    pdf_document.close()
+    return results
+
+
+# Extract the Embedded Images of Many Files Into output_dir Once Each, With a manifest.json Mapping Them to Pages
+def extract_images(sources, output_dir, password=None, names=None, workers=None, chunk_pages=200, cancel=None, progress=None):
+    """Sources are file paths or PDF bytes. Images are found with get_page_images, so masks
+    are listed with the images they belong to and inline images are not included. The same
+    xref on many pages is one image, and images whose stored streams hash the same are
+    written once across all sources, named by that hash, so images already in output_dir
+    from an earlier run are not written again. A cancelled or failed run removes the images
+    it wrote and leaves the manifest of any earlier run in place."""
+    start = time.perf_counter()
+    names = names or [f"document {index + 1}" if isinstance(source, bytes) else str(source) for index, source in enumerate(sources)]
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+
+    # Large files are scanned in page chunks so a single file still spreads across the workers
+    groups = []
+    for index, source in enumerate(sources):
+        try:
+            pdf_document = open_source(source, password)
+            page_count = pdf_document.page_count
+            pdf_document.close()
+        except Exception:
+            page_count = 1  # The worker reports the error
+        groups.extend((index, (source, password, first, first + chunk_pages)) for first in range(0, max(page_count, 1), chunk_pages))
+
+    scanned = []
+
+    def on_scanned(result):
+        scanned.append(result)
+        if progress:
+            progress(0.5 * len(scanned) / len(groups), f"Scanned {len(scanned)} of {len(groups)} page groups")
+
+    scans = run_groups(_scan_images_worker, [args for _, args in groups], max(min(workers, len(groups)), 1), cancel, on_scanned)
+
+    # One entry per distinct stream, with every source, xref and page it appears on
+    source_reports = [{"source": name, "images": 0, "unreadable": 0, "error": ""} for name in names]
+    unreadable = set()
+    occurrences = {}
+    entries = {}
+    writers = {}
+    for (index, args), scan in zip(groups, scans):
+        if "error" in scan:
+            source_reports[index]["error"] = scan["error"]
+            continue
+        for xref in scan["unreadable"]:
+            if (index, xref) not in unreadable:
+                unreadable.add((index, xref))
+                source_reports[index]["unreadable"] += 1
+        for xref, image in scan["images"].items():
+            occurrence = occurrences.get((index, xref))
+            if occurrence is None:
+                source_reports[index]["images"] += 1
+                entry = entries.setdefault(image["digest"], {"digest": image["digest"], "file": None, "bytes": 0,
+                                                             "width": image["width"], "height": image["height"],
+                                                             "colorspace": image["colorspace"], "filter": image["filter"],
+                                                             "occurrences": []})
+                occurrence = occurrences[(index, xref)] = {"source": names[index], "xref": xref, "smask": image["smask"], "pages": []}
+                entry["occurrences"].append(occurrence)
+                writers.setdefault(image["digest"], (index, xref))
+            occurrence["pages"].extend(image["pages"])
+
+    # Images an earlier run already wrote are kept as they are
+    existing = {path.name.split(".")[0]: path for path in output_dir.iterdir() if not path.name.endswith(".part")}
+    for digest, path in existing.items():
+        if digest in entries:
+            entries[digest].update(file=path.name, bytes=path.stat().st_size)
+
+    write_jobs = {}
+    for digest, (index, xref) in writers.items():
+        if digest not in existing:
+            write_jobs.setdefault(index, []).append((xref, digest))
+    write_groups = [(sources[index], password, jobs[first:first + 64], str(output_dir))
+                    for index, jobs in write_jobs.items() for first in range(0, len(jobs), 64)]
+    new_digests = [digest for digest in writers if digest not in existing]
+
+    written = []
+
+    def on_written(results):
+        written.extend(results)
+        if progress:
+            progress(0.5 + 0.5 * len(written) / max(len(new_digests), 1), f"Wrote {len(written)} of {len(new_digests)} images")
+
+    try:
+        for results in run_groups(_write_images_worker, write_groups, max(min(workers, len(write_groups)), 1), cancel, on_written):
+            for result in results:
+                entries[result["digest"]].update(file=result["file"], bytes=result["bytes"])
+
+        manifest = output_dir / "manifest.json"
+        with open(f"{manifest}.part", "w", encoding="utf-8") as file:
+            json.dump({"sources": source_reports, "images": list(entries.values())}, file, indent=1)
+        os.replace(f"{manifest}.part", manifest)
+    except BaseException:
+        remove_files(path for digest in new_digests for path in output_dir.glob(f"{digest}.*"))
+        remove_files([output_dir / "manifest.json.part"])
+        raise
+
+    found = sum(report["images"] for report in source_reports)
+    return {"output_dir": str(output_dir), "manifest": str(manifest), "sources": source_reports, "images_found": found,
+            "images_unreadable": len(unreadable), "images_written": len(written), "images_kept": len(entries) - len(new_digests), "duplicates": found - len(entries),
+            "bytes": sum(result["bytes"] for result in written), "seconds": time.perf_counter() - start}
+
+
+# Split "file.pdf:1-3,5" into the Path and its Page Ranges, None Means All Pages
+def parse_merge_input(text):
+    match = MERGE_INPUT.match(text)
+    if match and not Path(text).exists():
+        return match.group(1), match.group(2)
+    return text, None
+
+
+# Write the Merged Pages so Far to the Temp File and Reopen it, Objects Already Written Leave Memory
+def _flush_merge_output(output, temp_file, saved):
+    if saved:
+        output.saveIncr()
+    else:
+        output.save(temp_file)
+    output.close()
+    return fitz.open(temp_file)
+
+
+# Merge an Ordered List of Inputs (Optionally with Page Ranges) into output_file with Bounded Memory
+def merge_files(inputs, output_file, flush_pages=500, max_open_files=8, dedup=True):
+    """Sources are kept in an LRU of at most max_open_files open documents, so inputs
+    listed several times are not reopened, and the output is appended to a temp file
+    every flush_pages pages. Once complete, the temp file is rewritten in full without
+    the page trees of earlier flushes, and only then replaces output_file. With dedup, objects added since the last flush are folded into identical earlier ones."""
+    start = time.perf_counter()
+    deduplicator = ObjectDeduplicator()
+    first_xref = 1
+    Path(output_file).parent.mkdir(parents=True, exist_ok=True)
+    temp_file = f"{output_file}.part"
+    compact_file = f"{output_file}.compact.part"
+    sources = OrderedDict()
+    output = fitz.open()
+    saved = False
+    pending_pages = 0
+    total_pages = 0
+    flushes = 0
+    try:
+        for item in inputs:
+            path, ranges = parse_merge_input(item)
+            source = sources.pop(path, None)
+            if source is None:
+                source = fitz.open(path)
+                if source.needs_pass:
+                    source.close()
+                    raise ValueError(f"{path} is password protected")
+            sources[path] = source
+            while len(sources) > max_open_files:
+                sources.popitem(last=False)[1].close()
+
+            split_ranges = parse_page_ranges(ranges, source.page_count) if ranges else [(1, source.page_count)]
+            for first, last in split_ranges:
+                if source.page_count:
+                    output.insert_pdf(source, from_page=first - 1, to_page=last - 1)
+                    pending_pages += last - first + 1
+
+            if pending_pages >= flush_pages:
+                if dedup:
+                    deduplicator.deduplicate(output, first_xref)
+                output = _flush_merge_output(output, temp_file, saved)
+                first_xref = output.xref_length()
+                saved = True
+                total_pages += pending_pages
+                pending_pages = 0
+                flushes += 1
+
+        if dedup:
+            deduplicator.deduplicate(output, first_xref)
+        output = _flush_merge_output(output, temp_file, saved)
+        total_pages += pending_pages
+        flushes += 1
+
+        # Every flush appended a revision holding the whole page tree, one full save drops the stale ones
+        if saved:
+            output.save(compact_file, garbage=1)
+            output.close()
+            os.replace(compact_file, output_file)
+            os.remove(temp_file)
+        else:
+            output.close()
+            os.replace(temp_file, output_file)
+    except BaseException:
+        if not output.is_closed:
+            output.close()
+        remove_files([temp_file, compact_file])
+        raise
+    finally:
+        for source in sources.values():
+            source.close()
+
+    return {"output": output_file, "inputs": len(inputs), "pages": total_pages, "flushes": flushes,
+            "bytes": os.path.getsize(output_file), "dedup": deduplicator.report, "seconds": time.perf_counter() - start}
+
+
+# Expand Files, Directories (all PDFs below them) and Glob Patterns, Keeping Order and Dropping Repeats
+def expand_inputs(patterns):
+    files = []
+    for pattern in patterns:
+        if Path(pattern).is_dir():
+            files.extend(str(path) for path in sorted(Path(pattern).rglob("*.pdf")))
+        elif any(char in pattern for char in "*?["):
+            files.extend(sorted(glob.glob(pattern, recursive=True)))
+        else:
+            files.append(pattern)
+    return list(dict.fromkeys(files))
+
+
+# Output Path Next to the Input or in output_dir
+def batch_output_path(input_file, options, suffix, extension=".pdf"):
+    name = f"{Path(input_file).stem}_{suffix}{extension}"
+    return str(Path(options["output_dir"] or Path(input_file).parent) / name)
+
+
+def _load_batch_input(input_file):
+    pdf_object = PDFManager()
+    pdf_object.load_pdf(input_file)
+    if pdf_object.need_password:
+        raise ValueError("Password protected files are not supported")
+    return pdf_object
+
+
+def _save_batch_output(pdf_object, output_file, **options):
+    result = pdf_object.save_file(output_file, **options)
+    if not result[0]:
+        raise OSError(result[1])
+    return output_file
+
+
+# Batch Commands Return the Outputs Written and Any Extra Report Fields for the JSON Line
+def batch_compress(input_file, options):
+    _load_batch_input(input_file)
+    if options["estimate"]:
+        return dict(estimate_compression(input_file, workers=options.get("inner_workers", 1)), outputs=[])
+    settings = dict(COMPRESS_PRESETS[options["preset"]])
+    settings.update({key: options[key] for key in ("dpi", "quality") if options[key] is not None})
+    report = compress_file(input_file, batch_output_path(input_file, options, "compressed"), options.get("inner_workers", 1),
+                           **settings)
+    return {"outputs": [report["output"]], "bytes_before": report["bytes_before"], "images": len(report["images"]),
+            "image_bytes_before": report["image_bytes_before"], "image_bytes_after": report["image_bytes_after"], "dedup": report["dedup"]}
+
+
+def batch_encrypt(input_file, options):
+    pdf_object = _load_batch_input(input_file)
+    output = _save_batch_output(pdf_object, batch_output_path(input_file, options, "encrypted"),
+                                owner_pass=options["owner_password"], user_pass=options["user_password"],
+                                encryption=fitz.PDF_ENCRYPT_AES_256)
+    return {"outputs": [output]}
+
+
+def batch_split(input_file, options):
+    pdf_object = _load_batch_input(input_file)
+    output_dir = options["output_dir"] or Path(input_file).parent
+    if options["max_size"]:
+        report = pdf_object.split_pdf_by_size(int(options["max_size"] * 1024 * 1024), output_dir, workers=options.get("inner_workers", 1))
+    else:
+        split_ranges = parse_page_ranges(options["ranges"], pdf_object.get_page_count)
+        report = pdf_object.split_pdf(split_ranges, output_dir, workers=options.get("inner_workers", 1))
+    return {"outputs": [output["output"] for output in report["outputs"]]}
+
+
+def batch_text(input_file, options):
+    _load_batch_input(input_file)
+    output_file = batch_output_path(input_file, options, options["mode"], "." + options["format"])
+    report = export_text(input_file, output_file, options["mode"], options["format"], workers=options.get("inner_workers", 1))
+    return {"outputs": [report["output"]], "pages": report["pages"], "pages_per_second": round(report["pages_per_second"], 1)}
+
+
+def batch_render(input_file, options):
+    pdf_object = _load_batch_input(input_file)
+    page_numbers = None
+    if options["pages"]:
+        page_numbers = [page_number - 1 for first, last in parse_page_ranges(options["pages"], pdf_object.get_page_count)
+                        for page_number in range(first, last + 1)]
+    output_dir = Path(options["output_dir"] or Path(input_file).parent) / f"{Path(input_file).stem}_pages"
+    report = rasterize_file(input_file, output_dir, Path(input_file).stem, page_numbers, options["dpi"], options["colorspace"],
+                            options["format"], options["quality"], workers=options.get("inner_workers", 1))
+    return {"outputs": [output["output"] for output in report["outputs"]], "pages": report["pages"],
+            "pages_per_second": round(report["pages_per_second"], 1)}
+
+
+def batch_images(input_files, options):
+    report = extract_images(input_files, options["output_dir"], workers=options.get("inner_workers", 1))
+
+    # Files that could not be opened fail the job, the images of the others are still extracted
+    failed = [source for source in report["sources"] if source["error"]]
+    return {"ok": not failed, "error": "; ".join(f"{source['source']}: {source['error']}" for source in failed),
+            "outputs": [report["manifest"]], "images_found": report["images_found"], "images_written": report["images_written"],
+            "images_unreadable": report["images_unreadable"], "duplicates": report["duplicates"], "image_bytes": report["bytes"]}
+
+
+def batch_merge(input_files, options):
+    report = merge_files(input_files, options["output"], options["flush_pages"], options["max_open_files"], options["dedup"])
+    return {"outputs": [report["output"]], "pages": report["pages"], "dedup": report["dedup"]}
+
+
+BATCH_COMMANDS = {"compress": batch_compress, "encrypt": batch_encrypt, "split": batch_split, "merge": batch_merge,
+                  "text": batch_text, "render": batch_render, "images": batch_images}
+
+
+# Run One Batch Job in a Worker Process, Errors are Reported in the Result Instead of Raised
+def _run_batch_job(command, job_input, options):
+    start = time.perf_counter()
+    result = {"command": command, "input": job_input, "ok": True, "outputs": [], "error": ""}
+    try:
+        result.update(BATCH_COMMANDS[command](job_input, options))
+    except Exception as e:
+        result.update(ok=False, error=str(e))
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    result["output_bytes"] = [Path(output).stat().st_size for output in result["outputs"]]
+    result["bytes_out"] = sum(result["output_bytes"])
+    return result
+
+
+def build_cli_parser():
+    parser = argparse.ArgumentParser(
+        prog="PDF_Manager_V1.0.py",
+        description="Run PDF Manager operations over many files without the GUI. "
+                    "One JSON line is printed per job. Arguments starting with @ are read from files.",
+        fromfile_prefix_chars="@")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes (default: all cores)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    for name, help_text in (("compress", "compress each file"), ("encrypt", "encrypt each file with AES-256"),
+                            ("split", "split each file into page ranges"), ("merge", "merge all files in order into one"),
+                            ("text", "export the text of each file to TXT or JSONL"),
+                            ("render", "export the pages of each file as PNG, JPEG or TIFF images"),
+                            ("images", "extract the embedded images of all files once each, with a manifest")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("inputs", nargs="+", help="PDF files, directories or glob patterns"
+                             + (", each may end with :page-ranges" if name == "merge" else ""))
+        if name == "merge":
+            command.add_argument("-o", "--output", required=True, help="merged PDF file")
+            command.add_argument("--flush-pages", type=int, default=500, help="append to the output file every N pages")
+            command.add_argument("--max-open-files", type=int, default=8, help="source files kept open at once")
+            command.add_argument("--no-dedup", dest="dedup", action="store_false", help="keep duplicate fonts and images")
+        elif name == "images":
+            command.add_argument("-o", "--output-dir", required=True, help="directory for the images and manifest.json")
+        else:
+            command.add_argument("-o", "--output-dir", help="directory for the outputs (default: next to each input)")
+        if name == "split":
+            split_mode = command.add_mutually_exclusive_group(required=True)
+            split_mode.add_argument("--ranges", help="page ranges like 1-3,5,7-9, or every N")
+            split_mode.add_argument("--max-size", type=float, help="fewest parts that are each under this many MB")
+        if name == "compress":
+            command.add_argument("--preset", choices=COMPRESS_PRESETS, default="ebook", help="image settings (default: ebook)")
+            command.add_argument("--dpi", type=int, help="downsample images placed above this resolution, overrides the preset")
+            command.add_argument("--quality", type=int, help="JPEG quality of recompressed images, overrides the preset")
+            command.add_argument("--estimate", action="store_true", help="only print the projected size and time of every preset")
+        if name == "text":
+            command.add_argument("--mode", choices=("text", "blocks", "words"), default="text",
+                                 help="plain text, text blocks or words with their boxes (default: text)")
+            command.add_argument("--format", choices=("txt", "jsonl"), default="txt", help="output format (default: txt)")
+        if name == "render":
+            command.add_argument("--pages", help="page ranges like 1-3,5 (default: all pages)")
+            command.add_argument("--dpi", type=int, default=150, help="resolution of the images (default: 150)")
+            command.add_argument("--colorspace", choices=("rgb", "gray", "bilevel"), default="rgb", help="colours of the images (default: rgb)")
+            command.add_argument("--format", choices=RASTER_FORMATS, default="png", help="image format (default: png)")
+            command.add_argument("--quality", type=int, default=90, help="JPEG quality (default: 90)")
+        if name == "encrypt":
+            command.add_argument("--owner-password", required=True)
+            command.add_argument("--user-password", required=True)
+    return parser
+
+
+# Batch Entry Point, Returns 0 When Every Job Succeeded, 1 When Any Failed and 2 for Usage Errors
+def cli_main(argv):
+    args = build_cli_parser().parse_args(argv)
+    input_files = expand_inputs(args.inputs)
+    if not input_files:
+        print("No input PDF files found.", file=sys.stderr)
+        return 2
+
+    options = {key: value for key, value in vars(args).items() if key not in ("command", "inputs", "workers")}
+    options.setdefault("output_dir", None)
+    if options["output_dir"]:
+        Path(options["output_dir"]).mkdir(parents=True, exist_ok=True)
+
+    # Merge and image extraction are single jobs over all files, every other command is one job per file
+    jobs = [input_files] if args.command in ("merge", "images") else input_files
+
+    # A single job is split, compressed, exported or extracted across the workers instead
+    if args.command in ("split", "compress", "text", "render", "images") and len(jobs) == 1:
+        result = _run_batch_job(args.command, jobs[0], dict(options, inner_workers=args.workers))
+        print(json.dumps(result), flush=True)
+        return 0 if result["ok"] else 1
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max(min(args.workers, len(jobs)), 1)) as pool:
+        futures = [pool.submit(_run_batch_job, args.command, job_input, options) for job_input in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            failed += not result["ok"]
+            print(json.dumps(result), flush=True)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    # Any arguments run the batch command line instead of the GUI
+    if len(sys.argv) > 1:
+        sys.exit(cli_main(sys.argv[1:]))
 
-if __name__ == "__main__":
     root = Tk()
     pdf_viewer = GUI(root)
     root.mainloop()
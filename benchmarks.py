@@ -0,0 +1,403 @@
+# Benchmarks of PDF Manager, Each Prints its Results as JSON Lines, e.g. python benchmarks.py render file.pdf
+from tkinter import Tk, PhotoImage, TclError
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from io import BytesIO
+from PIL import Image, ImageTk
+import importlib.util
+import argparse
+import json
+import os
+import sys
+import time
+import shutil
+import tempfile
+import tracemalloc
+import fitz  # PyMuPDF
+
+try:
+    import resource  # Unix only, used for peak RSS
+except ImportError:
+    resource = None
+
+# The application file name is no module name, it is loaded from next to this script and registered
+# under one so worker processes that re-run this script find its functions too
+_spec = importlib.util.spec_from_file_location("pdf_manager", Path(__file__).with_name("PDF_Manager_V1.0.py"))
+pdf_manager = importlib.util.module_from_spec(_spec)
+sys.modules["pdf_manager"] = pdf_manager
+_spec.loader.exec_module(pdf_manager)
+
+from pdf_manager import PDFManager, draft_scale, pixmap_to_photo, export_text, rasterize_file
+
+
+# Render one page the old way (72 dpi + PIL resize) or natively at the zoom, in a fresh process
+def _benchmark_render_worker(file_path, page_number, zoom, path, repeat, draft_pixels):
+    pdf = PDFManager()
+    pdf.load_pdf(file_path)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        if path == "native":
+            pix = pdf.render_page(page_number, zoom)
+            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+        elif path == "draft":
+            width, height = pdf.get_page_size(page_number)
+            pix = pdf.render_page(page_number, draft_scale(width, height, zoom, draft_pixels), draft=True)
+            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+            img = img.resize((int(width * zoom), int(height * zoom)), Image.NEAREST)
+        else:
+            pix = pdf.get_page(page_number).get_pixmap()
+            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+            img = img.resize((int(pix.width * zoom), int(pix.height * zoom)), Image.ADAPTIVE)
+    ms_per_frame = (time.perf_counter() - start) * 1000 / repeat
+
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak_rss = None
+    if resource:
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak_rss *= 1 if sys.platform == "darwin" else 1024
+    return {"megapixels": img.width * img.height / 1e6, "ms_per_frame": ms_per_frame, "peak_rss": peak_rss}
+
+
+# Compare time per frame and peak RSS of the resize path, native rendering and draft rendering
+def benchmark_render(file_path, page_number=0, zooms=(1.5, 3.0, 4.5, 6.5), repeat=3,
+                     paths=("resize", "native", "draft"), draft_pixels=2_000_000):
+    results = []
+    for zoom in zooms:
+        for path in paths:
+            # Each case runs in its own process so peak RSS is not shared between cases
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                result = pool.submit(_benchmark_render_worker, file_path, page_number, zoom, path, repeat, draft_pixels).result()
+            result.update(zoom=zoom, path=path)
+            results.append(result)
+    return results
+
+
+# Compare Time per Frame of pixmap_to_photo With a PPM Round Trip Through Tk, Failing if it Exceeds max_ms_per_frame
+def benchmark_photo_conversion(file_path, page_number=0, zooms=(1.0, 2.0, 4.0), repeat=10, max_ms_per_frame=None):
+    # Without a display only the part outside Tk is timed, PIL unpacking the view against PIL decoding the PPM
+    pdf = PDFManager()
+    pdf.load_pdf(file_path)
+    try:
+        tk_root = Tk()
+        tk_root.withdraw()
+    except Exception:
+        tk_root = None
+
+    def view(pix):
+        if tk_root:
+            return pixmap_to_photo(pix)
+        # RGB is kept as 4 bytes per pixel, so PIL unpacks the view here rather than mapping it
+        return Image.frombuffer("RGB", (pix.width, pix.height), pix.samples_mv, "raw", "RGB", 0, 1)
+
+    def ppm(pix):
+        data = pix.tobytes("ppm")
+        if tk_root:
+            return PhotoImage(data=data, format="ppm")
+        img = Image.open(BytesIO(data))
+        img.load()
+        return img
+
+    results = []
+    for zoom in zooms:
+        pix = pdf.render_page(page_number, zoom)
+        timings = {}
+        for path, convert in (("view", view), ("ppm", ppm)):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                img = convert(pix)
+                del img
+            timings[path] = (time.perf_counter() - start) * 1000 / repeat
+            results.append({"zoom": zoom, "path": path, "tk": tk_root is not None,
+                            "megapixels": pix.width * pix.height / 1e6, "ms_per_frame": timings[path]})
+        results[-2]["speedup"] = timings["ppm"] / max(timings["view"], 1e-9)
+        del pix
+
+    if tk_root:
+        tk_root.destroy()
+    pdf.pdf_document.close()
+
+    # The guard only covers the path the viewer uses
+    slow = [result for result in results if result["path"] == "view" and max_ms_per_frame is not None
+            and result["ms_per_frame"] > max_ms_per_frame]
+    if slow:
+        raise AssertionError(f"pixmap_to_photo took {slow[0]['ms_per_frame']:.1f} ms per frame at zoom {slow[0]['zoom']}, "
+                             f"over the {max_ms_per_frame} ms budget")
+    return results
+
+
+# Time each show_page stage of the copying pipeline and the view based one, with the bytes each stage copies
+def benchmark_show_page(file_path, page_number=0, zoom=2.0, repeat=5):
+    pdf = PDFManager()
+    pdf.load_pdf(file_path)
+
+    # Photo images need a Tk interpreter with a display, without one that stage is not timed
+    try:
+        tk_root = Tk()
+        tk_root.withdraw()
+    except Exception:
+        tk_root = None
+
+    timings = {}
+
+    def measure(path, stage, bytes_copied, function):
+        start = time.perf_counter()
+        result = function()
+        entry = timings.setdefault((path, stage), {"path": path, "stage": stage, "ms": 0.0, "bytes_copied": bytes_copied})
+        entry["ms"] += (time.perf_counter() - start) * 1000 / repeat
+        return result
+
+    for _ in range(repeat):
+        pix = measure("copy", "render", 0, lambda: pdf.render_page(page_number, zoom))
+        size = pix.width * pix.height
+
+        # PIL keeps RGB as 4 bytes per pixel, and so does Tk
+        samples = measure("copy", "samples", size * 3, lambda: pix.samples)
+        img = measure("copy", "frombytes", size * 4, lambda: Image.frombytes("RGB", [pix.width, pix.height], samples))
+        if tk_root:
+            measure("copy", "photo", size * 4, lambda: ImageTk.PhotoImage(img))
+
+        pix = measure("view", "render", 0, lambda: pdf.render_page(page_number, zoom))
+        samples = measure("view", "samples", 0, lambda: pix.samples_mv)
+        img = measure("view", "frombuffer", size * 4, lambda: Image.frombuffer("RGB", (pix.width, pix.height), samples, "raw", "RGB", 0, 1))
+        if tk_root:
+            measure("view", "photo", size * 4, lambda: ImageTk.PhotoImage(img))
+
+    if tk_root:
+        tk_root.destroy()
+    return list(timings.values())
+
+
+# Write a Benchmark Document of pages Text Pages, Every image_every-th With its Own Incompressible Image
+def synthetic_document(file_path, pages, image_every=0, image_size=(400, 300)):
+    doc = fitz.open()
+    for page_number in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Page {page_number + 1} " + "The quick brown fox jumps over the lazy dog. " * 8)
+        if image_every and page_number % image_every == 0:
+            img = Image.frombytes("RGB", image_size, os.urandom(image_size[0] * image_size[1] * 3))
+            buffer = BytesIO()
+            img.save(buffer, "JPEG", quality=90)
+            page.insert_image(fitz.Rect(72, 100, 472, 400), stream=buffer.getvalue())
+    doc.save(file_path, garbage=1)
+    doc.close()
+    return file_path
+
+
+# Time the Page List Update of a Page Turn Against the Old Rebuild of the List, for Documents of Each Page Count
+def benchmark_page_turn(page_counts=(100, 1000, 10000), turns=50, old_turns=5):
+    # The page list is a Tk Listbox, without a display there is nothing to time
+    try:
+        tk_root = Tk()
+    except TclError:
+        print("page-turn skipped: it times the Tk page list and needs a display", file=sys.stderr)
+        return []
+    tk_root.withdraw()
+    gui = pdf_manager.GUI(tk_root)
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for page_count in page_counts:
+            pdf = PDFManager()
+            pdf.load_pdf(synthetic_document(str(Path(work_dir) / f"pages_{page_count}.pdf"), page_count))
+            gui.pdf_object = pdf
+            gui.num_pages = page_count
+            gui.current_page = 0
+
+            # The list is filled once per document, as load_pdf does
+            start = time.perf_counter()
+            gui.populate_page_list()
+            tk_root.update_idletasks()
+            fill_ms = (time.perf_counter() - start) * 1000
+
+            # Turns go to pages spread over the whole document, each one drawn before the next
+            start = time.perf_counter()
+            for turn in range(turns):
+                gui.current_page = turn * (page_count - 1) // max(turns - 1, 1)
+                gui.update_page_selection()
+                tk_root.update_idletasks()
+            ms_per_turn = (time.perf_counter() - start) * 1000 / turns
+
+            # What every turn did before, emptying and refilling the list one label at a time
+            listbox = gui.page_listbox
+            start = time.perf_counter()
+            for turn in range(old_turns):
+                listbox.delete(0, "end")
+                for page_number in range(1, page_count + 1):
+                    listbox.insert(page_number, f"Page {page_number}")
+                listbox.selection_clear(0, "end")
+                listbox.selection_set(turn * (page_count - 1) // max(old_turns - 1, 1))
+                listbox.activate(turn * (page_count - 1) // max(old_turns - 1, 1))
+                tk_root.update_idletasks()
+            rebuild_ms_per_turn = (time.perf_counter() - start) * 1000 / old_turns
+
+            gui.populate_page_list()
+            pdf.pdf_document.close()
+            results.append({"pages": page_count, "fill_ms": fill_ms, "ms_per_turn": ms_per_turn,
+                            "rebuild_ms_per_turn": rebuild_ms_per_turn,
+                            "ms_growth": ms_per_turn / results[0]["ms_per_turn"] if results else 1.0,
+                            "rebuild_ms_growth": rebuild_ms_per_turn / results[0]["rebuild_ms_per_turn"] if results else 1.0})
+
+    gui.pdf_object = PDFManager()
+    tk_root.destroy()
+    return results
+
+
+# Bytes This Process Has Passed to write() so Far, From /proc on Linux and None Elsewhere
+def written_bytes():
+    try:
+        with open("/proc/self/io") as file:
+            for line in file:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+# Compare Save Time and Bytes Written of an Incremental Save With a Full Rewrite After Deleting Pages
+def benchmark_save(file_path, delete_pages=1, repeat=3):
+    # Every run works on an untimed fresh copy, the full rewrite uses the options of the compacting save
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        copy_file = str(Path(work_dir) / "copy.pdf")
+        for mode in ("incremental", "full"):
+            seconds = bytes_written = io_bytes = 0
+            for _ in range(repeat):
+                shutil.copyfile(file_path, copy_file)
+                pdf = PDFManager()
+                pdf.load_pdf(copy_file)
+                for _ in range(delete_pages):
+                    pdf.delete_page_no(0)
+
+                io_before = written_bytes()
+                start = time.perf_counter()
+                if mode == "incremental":
+                    bytes_written += pdf.save_in_place(max_growth=1.0)["bytes_written"]
+                else:
+                    output_file = str(Path(work_dir) / "full.pdf")
+                    pdf.save_file(output_file, garbage=3, deflate=True)
+                    bytes_written += os.path.getsize(output_file)
+                seconds += time.perf_counter() - start
+                io_bytes = None if io_before is None else io_bytes + written_bytes() - io_before
+                pdf.pdf_document.close()
+            results.append({"mode": mode, "pages_deleted": delete_pages, "ms": seconds * 1000 / repeat,
+                            "bytes_written": bytes_written // repeat,
+                            "io_bytes": None if io_bytes is None else io_bytes // repeat})
+    return results
+
+
+# Time Recording, Undoing and Redoing steps Alternating Page Deletes and Moves
+def benchmark_undo(file_path, steps=100):
+    pdf = PDFManager()
+    pdf.load_pdf(file_path)
+
+    # Flattening the page tree happens once per opening, it is timed on its own
+    start = time.perf_counter()
+    pdf.page_tree()
+    flatten_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    for step in range(steps):
+        if step % 2:
+            pdf.move_page(0, pdf.get_page_count - 1)
+        else:
+            pdf.delete_page_no(pdf.get_page_count // 2)
+    edit_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    pdf.undo(steps)
+    undo_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    pdf.redo(steps)
+    redo_ms = (time.perf_counter() - start) * 1000
+
+    step_bytes = sum(sys.getsizeof(step) + sum(sys.getsizeof(item) for item in step) for step in pdf.history.undo_steps)
+    pages = pdf.get_page_count
+    pdf.pdf_document.close()
+    return {"pages": pages, "steps": steps, "flatten_ms": flatten_ms, "edit_ms": edit_ms,
+            "undo_ms": undo_ms, "redo_ms": redo_ms, "bytes_per_step": step_bytes / max(steps, 1)}
+
+
+# Planning and Writing Time of Split by Size, for Each Size Limit and Worker Count
+def benchmark_split_by_size(file_path=None, max_mb=(1, 5, 20), workers=(1, None), pages=5000, image_every=10):
+    # Without file_path an untimed document of pages pages is generated, every image_every-th with a 100 KB image
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        file_path = file_path or synthetic_document(str(Path(work_dir) / "synthetic.pdf"), pages, image_every)
+        pdf = PDFManager()
+        pdf.load_pdf(file_path)
+        for limit in max_mb:
+            for worker_count in workers:
+                worker_count = worker_count or os.cpu_count() or 1
+                output_dir = Path(work_dir) / f"split_{limit}_{worker_count}"
+                report = pdf.split_pdf_by_size(int(limit * 1024 * 1024), output_dir, workers=worker_count)
+                results.append({"max_mb": limit, "workers": worker_count, "pages": pdf.get_page_count,
+                                "parts": len(report["outputs"]), "oversized": len(report["oversized"]),
+                                "largest_bytes": max(output["bytes"] for output in report["outputs"]),
+                                "plan_seconds": report["plan_seconds"], "seconds": report["seconds"],
+                                "pages_per_second": pdf.get_page_count / report["seconds"]})
+                shutil.rmtree(output_dir)
+        pdf.pdf_document.close()
+    return results
+
+
+# Pages per Second per Core and Peak Memory of the Text Export, for Each Mode and Worker Count
+def benchmark_text_export(file_path, modes=("text", "blocks", "words"), workers=(1, None), output_format="jsonl"):
+    # peak_traced_bytes is the Python memory of this process only, each worker holds at most two chunks of pages
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for mode in modes:
+            for worker_count in workers:
+                worker_count = worker_count or os.cpu_count() or 1
+                tracemalloc.start()
+                report = export_text(file_path, Path(work_dir) / f"out.{output_format}", mode, output_format, workers=worker_count)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                results.append({"mode": mode, "workers": worker_count, "pages": report["pages"], "bytes": report["bytes"],
+                                "seconds": report["seconds"], "pages_per_second": report["pages_per_second"],
+                                "pages_per_second_per_core": report["pages_per_second"] / worker_count,
+                                "peak_traced_bytes": peak})
+    return results
+
+
+# Pages per Second per Core of Page Image Export, for Each Worker Count
+def benchmark_rasterize(file_path, dpi=300, colorspace="rgb", image_format="png", workers=(1, None)):
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for worker_count in workers:
+            worker_count = worker_count or os.cpu_count() or 1
+            tracemalloc.start()
+            report = rasterize_file(file_path, work_dir, "page", dpi=dpi, colorspace=colorspace, image_format=image_format,
+                                    workers=worker_count)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results.append({"workers": worker_count, "dpi": dpi, "colorspace": colorspace, "format": image_format,
+                            "pages": report["pages"], "bytes": report["bytes"], "seconds": report["seconds"],
+                            "pages_per_second": report["pages_per_second"],
+                            "pages_per_second_per_core": report["pages_per_second"] / worker_count, "peak_traced_bytes": peak})
+    return results
+
+
+# Benchmarks by Command Line Name, Those Without a File Generate Their Documents
+BENCHMARKS = {"render": benchmark_render, "photo": benchmark_photo_conversion, "show-page": benchmark_show_page,
+              "page-turn": benchmark_page_turn, "save": benchmark_save, "undo": benchmark_undo,
+              "split-by-size": benchmark_split_by_size, "text": benchmark_text_export, "rasterize": benchmark_rasterize}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time PDF Manager operations on a file or a generated document.")
+    parser.add_argument("benchmark", choices=BENCHMARKS)
+    parser.add_argument("file", nargs="?", help="PDF file to run on, page-turn and split-by-size generate one without it")
+    args = parser.parse_args(argv)
+    if args.file is None and args.benchmark not in ("page-turn", "split-by-size"):
+        parser.error(f"{args.benchmark} needs a PDF file")
+
+    results = BENCHMARKS[args.benchmark](*([args.file] if args.file else []))
+    for result in results if isinstance(results, list) else [results]:
+        print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())